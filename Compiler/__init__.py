@@ -1,4 +1,21 @@
-from . import compilerLib, program, instructions, types, library, floatingpoint
-from .GC import types as GC_types
-import inspect
+import importlib
 from .config import *
+
+# the core modules depend on being imported in this order
+from . import program, types
+
+# other submodules are only imported on first access as attribute of
+# the package in order to keep the start-up time low
+_aliases = {'GC_types': '.GC.types'}
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    try:
+        return importlib.import_module(_aliases.get(name, '.' + name),
+                                       __name__)
+    except ModuleNotFoundError as e:
+        if e.name != __name__ + _aliases.get(name, '.' + name):
+            raise
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name)) from None
@@ -1,4 +1,4 @@
-import itertools, time
+import array, itertools, time
 from collections import defaultdict, deque
 from Compiler.exceptions import *
 from Compiler.config import *
@@ -10,6 +10,7 @@ import Compiler.program
 import heapq, itertools
 import operator
 import sys
+import contextlib, io
 from functools import reduce
 
 class BlockAllocator:
@@ -154,7 +155,7 @@ class StraightlineAllocator:
     def __init__(self, n, program):
         self.alloc = dict_by_id()
         self.max_usage = defaultdict(lambda: 0)
-        self.defined = dict_by_id()
+        self.defined = set_by_id()
         self.dealloc = set_by_id()
         assert(n == REG_MAX)
         self.program = program
@@ -184,7 +185,7 @@ class StraightlineAllocator:
             self.dealloc |= reg.vector
         else:
             self.dealloc.add(reg)
-        reg.duplicates.remove(reg)
+        reg.remove_from_duplicates()
         base = reg.vectorbase
 
         seen = set_by_id()
@@ -212,11 +213,11 @@ class StraightlineAllocator:
         if reg not in self.program.base_addresses:
             free.free(base)
         if inst.is_vec() and base.vector:
-            self.defined[base] = inst
+            self.defined.add(base)
             for i in base.vector:
-                self.defined[i] = inst
+                self.defined.add(i)
         else:
-            self.defined[reg] = inst
+            self.defined.add(reg)
 
     def process(self, program, alloc_pool):
         self.update_usage(alloc_pool)
@@ -297,6 +298,147 @@ class StraightlineAllocator:
             p(sizes)
             print('Unused instructions:', dict(self.unused))
 
+class IntervalAllocator(StraightlineAllocator):
+    """Allocate variables in a straightline program from live intervals.
+    This produces the same allocation as :py:class:`StraightlineAllocator`
+    but avoids searching the duplicates and vector elements at every
+    definition. Instead, the registers sharing an address are grouped
+    once per basic block, and the number of elements not yet defined is
+    kept per group. One pass over the instructions determines the
+    intervals, and the addresses are then assigned in a sweep over the
+    sorted interval ends."""
+
+    def process(self, program, alloc_pool):
+        self.update_usage(alloc_pool)
+        alloc = self.alloc.content
+        dealloc = self.dealloc.content
+        defined = self.defined.content
+        base_addresses = self.program.base_addresses.content
+        # vector bases allocated in this block with the index
+        # (in reverse order) of their last use, the address is only
+        # known after the sweep
+        to_alloc = []
+        starts = array.array('q')
+        # registers to free with the index of their first definition
+        to_free = []
+        ends = array.array('q')
+        groups = {}
+        outstanding = array.array('q')
+
+        def add(base, k):
+            # duplicates are removed when defined, so they are stored here
+            regs = [base]
+            if len(base.duplicates) > 1:
+                regs.extend(dup.vectorbase for dup in base.duplicates)
+            for reg in regs:
+                alloc[id(reg)] = reg, None
+            to_alloc.append(regs)
+            starts.append(k)
+
+        for k,i in enumerate(reversed(program)):
+            defs = list(i.get_def())
+            unused_regs = []
+            for j in defs:
+                base = j.vectorbase
+                if id(base) in alloc:
+                    if id(j) in defined:
+                        raise CompilerError("Double write on register %s " \
+                                            "assigned by '%s' in %s" % \
+                                                (j,i,format_trace(i.caller)))
+                else:
+                    # unused register
+                    add(base, k)
+                    unused_regs.append(j)
+            if unused_regs and len(unused_regs) == len(defs) and \
+               self.program.verbose:
+                self.unused[type(i).__name__] += 1
+                if self.program.verbose > 1:
+                    print(
+                        "Register(s) %s never used, assigned by '%s' in %s" % \
+                        (unused_regs,i,format_trace(i.caller)))
+
+            for j in i.get_used():
+                base = j.vectorbase
+                if id(base) not in alloc:
+                    add(base, k)
+
+            for j in defs:
+                base = j.vectorbase
+                group = groups.get(id(base))
+                if group is None and base is j and not j.vector and \
+                   len(j.duplicates) == 1:
+                    # register on its own
+                    dealloc[id(j)] = j
+                else:
+                    if group is None:
+                        group = self.new_group(base, groups, outstanding)
+                    for x in j.vector or (j,):
+                        if id(x) not in dealloc:
+                            dealloc[id(x)] = x
+                            outstanding[group] -= 1
+                j.remove_from_duplicates()
+                if group is not None and outstanding[group]:
+                    # not all vector elements ready for deallocation
+                    continue
+                if id(j) not in base_addresses:
+                    to_free.append(base)
+                    ends.append(k)
+                if i.is_vec() and base.vector:
+                    defined[id(base)] = base
+                    for x in base.vector:
+                        defined[id(x)] = x
+                else:
+                    defined[id(j)] = j
+
+            if k % 1000000 == 0 and k > 0:
+                print("Determined intervals for %d instructions at" % k,
+                      time.asctime())
+
+        n = 0
+        for base, k in zip(to_free, ends):
+            while n < len(to_alloc) and starts[n] <= k:
+                self.assign(to_alloc[n], alloc_pool)
+                n += 1
+            alloc_pool.free(base)
+        for regs in to_alloc[n:]:
+            self.assign(regs, alloc_pool)
+
+        self.update_max_usage(alloc_pool)
+        alloc_pool.consolidate()
+        return self.max_usage
+
+    def new_group(self, base, groups, outstanding):
+        """ Collect all vector bases connected by duplicates and count
+        the registers not defined yet. """
+        group = len(outstanding)
+        dealloc = self.dealloc.content
+        n = 0
+        to_check = [base]
+        seen = set()
+        while to_check:
+            dup = to_check.pop()
+            if id(dup) in seen:
+                continue
+            seen.add(id(dup))
+            base = dup.vectorbase
+            if id(base) not in groups:
+                groups[id(base)] = group
+                for x in base.vector or (base,):
+                    if id(x) not in dealloc:
+                        n += 1
+                    if len(x.duplicates) > 1:
+                        to_check.extend(x.duplicates)
+            to_check.extend(dup.duplicates)
+            to_check.extend(base.duplicates)
+        outstanding.append(n)
+        return group
+
+    def assign(self, regs, alloc_pool):
+        res = alloc_pool.alloc(regs[0].reg_type, regs[0].size)
+        for reg in regs:
+            self.alloc.content[id(reg)] = reg, res
+            reg.i = res
+
 def determine_scope(block, options):
     last_def = defaultdict_by_id(lambda: -1)
     used_from_scope = set_by_id()
@@ -344,14 +486,22 @@ class Merger:
             self.max_parallel_open = float('inf')
         self.counter = defaultdict(lambda: 0)
         self.rounds = defaultdict(lambda: 0)
+        self.merged = []
+        self.order = None
         self.dependency_graph(merge_classes)
 
+    def warn_about_mem(self, long_vector=False):
+        print('WARNING: Order of memory instructions not preserved%s, '
+              'errors possible' % (' due to long vector' * long_vector))
+        self.block.parent.warned_about_mem = True
+
     def do_merge(self, merges_iter):
         """ Merge an iterable of nodes in G, returning the number of merged
         instructions and the index of the merged instruction. """
         # sort merges, necessary for inputb
         merge = list(merges_iter)
         merge.sort()
+        self.merged.append(merge)
         merges_iter = iter(merge)
         instructions = self.instructions
         mergecount = 0
@@ -408,6 +558,7 @@ class Merger:
         if len(instructions) > 1000000:
             print("Topological sort ...")
         order = Compiler.graph.topological_sort(G, preorder)
+        self.order = order
         instructions[:] = [instructions[i] for i in order if instructions[i] is not None]
         if len(instructions) > 1000000:
             print("Done at", time.asctime())
@@ -426,7 +577,10 @@ class Merger:
                                 triple='green', square='green', bit='green',\
                                 asm_input='lightgreen')
 
-        G = Compiler.graph.SparseDiGraph(len(block.instructions))
+        if options.compact_graph:
+            G = Compiler.graph.CompactDiGraph(len(block.instructions))
+        else:
+            G = Compiler.graph.SparseDiGraph(len(block.instructions))
         self.G = G
 
         reg_nodes = {}
@@ -499,9 +653,7 @@ class Merger:
                 if block.warn_about_mem and \
                    not block.parent.warned_about_mem and \
                    (instr.get_size() > 100) and not instr._protect:
-                    print('WARNING: Order of memory instructions ' \
-                        'not preserved due to long vector, errors possible')
-                    block.parent.warned_about_mem = True
+                    self.warn_about_mem(long_vector=True)
             else:
                 handle_mem_access(addr, reg_type, last_access_this_kind,
                                   last_access_other_kind)
@@ -509,9 +661,7 @@ class Merger:
                not block.parent.warned_about_mem and \
                not isinstance(instr, DirectMemoryInstruction) and \
                not instr._protect:
-                print('WARNING: Order of memory instructions ' \
-                    'not preserved, errors possible')
-                block.parent.warned_about_mem = True
+                self.warn_about_mem()
 
         def strict_mem_access(n, last_this_kind, last_other_kind):
             if last_other_kind and last_this_kind and \
@@ -611,8 +761,7 @@ class Merger:
                             max_dependencies_per_matrix = 1500**2
                             if first_factor_total_number_of_values > max_dependencies_per_matrix or second_factor_total_number_of_values > max_dependencies_per_matrix:
                                 if block.warn_about_mem and not block.parent.warned_about_mem:
-                                    print('WARNING: Order of memory instructions not preserved due to long vector, errors possible')
-                                    block.parent.warned_about_mem = True
+                                    self.warn_about_mem(long_vector=True)
 
                             # Add dependencies to the first factor.
                             # If the size of the matrix exceeds the max_dependencies_per_matrix, only a limited number
@@ -631,8 +780,7 @@ class Merger:
                                 if (time.time() - start_time) > 10:
                                     # Abort building the dependencies if that takes too much time.
                                     if block.warn_about_mem and not block.parent.warned_about_mem:
-                                        print('WARNING: Order of memory instructions not preserved due to long vector, errors possible')
-                                        block.parent.warned_about_mem = True
+                                        self.warn_about_mem(long_vector=True)
                                     break
 
                                 for j in range(instr.args[12 * matmul_idx + 5]):
@@ -703,7 +851,7 @@ class Merger:
                 for i_inst in shuffles[instr.args[0]]:
                     add_edge(i_inst, n)
 
-            if not G.pred[n]:
+            if G.is_source(n):
                 self.sources.append(n)
 
             if n % 1000000 == 0 and n > 0:
@@ -713,14 +861,8 @@ class Merger:
     def merge_nodes(self, i, j):
         """ Merge node j into i, removing node j """
         G = self.G
-        if j in G[i]:
-            G.remove_edge(i, j)
-        if i in G[j]:
-            G.remove_edge(j, i)
-        G.add_edges_from(list(zip(itertools.cycle([i]), G[j], [G.weights[(j,k)] for k in G[j]])))
-        G.add_edges_from(list(zip(G.pred[j], itertools.cycle([i]), [G.weights[(k,j)] for k in G.pred[j]])))
         G.get_attr(i, 'merges').append(j)
-        G.remove_node(j)
+        G.merge_nodes(i, j)
 
     def eliminate_dead_code(self):
         instructions = self.instructions
@@ -772,7 +914,127 @@ class Merger:
             print('%d: %s' % (self.depths[i], self.instructions[i]), file=f)
         f.close()
 
+class MergePlanner(Merger):
+    """ Merger for use in a worker process. It records the changes
+    and the output so that :py:class:`MergePlan` can repeat them on
+    the original block. """
+    def __init__(self, *args):
+        self.mem_warning = False
+        self.output = []
+        self.capture(super(MergePlanner, self).__init__, *args)
+
+    def capture(self, f, *args):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            res = f(*args)
+        self.output.append(out.getvalue())
+        return res
+
+    def warn_about_mem(self, long_vector=False):
+        self.mem_warning = long_vector + 1
+        self.block.parent.warned_about_mem = True
+
+    def eliminate_dead_code(self):
+        self.capture(super(MergePlanner, self).eliminate_dead_code)
+        self.dead = [i for i, inst in enumerate(self.instructions)
+                     if inst is None]
+
+    def longest_paths_merge(self):
+        return self.capture(super(MergePlanner, self).longest_paths_merge)
+
+    def get_plan(self):
+        return self.output, self.mem_warning, getattr(self, 'dead', []), \
+            self.merged, self.order, sorted(self.open_nodes)
+
+class MergePlan:
+    """ Replays the result of :py:class:`MergePlanner` with the same
+    interface as :py:class:`Merger`. """
+    def __init__(self, block, plan):
+        self.block = block
+        self.instructions = block.instructions
+        self.output, mem_warning, self.dead, self.merged, self.order, \
+            self.open_nodes = plan
+        self.output.reverse()
+        self.counter = defaultdict(lambda: 0)
+        self.rounds = defaultdict(lambda: 0)
+        self.req_num = defaultdict(lambda: 0)
+        print(self.output.pop(), end='')
+        if mem_warning and not block.parent.warned_about_mem:
+            Merger.warn_about_mem(self, long_vector=mem_warning > 1)
+
+    def eliminate_dead_code(self):
+        print(self.output.pop(), end='')
+        for i in self.dead:
+            self.instructions[i] = None
+
+    def longest_paths_merge(self):
+        print(self.output.pop(), end='')
+        instructions = self.instructions
+        for merge in self.merged:
+            t = type(instructions[merge[0]])
+            self.counter[t] += len(merge)
+            self.rounds[t] += 1
+            self.req_num[t.__name__, 'round'] += 1
+            n = merge[0]
+            for i in merge[1:]:
+                instructions[n].merge(instructions[i])
+                instructions[i] = None
+        if self.order is not None:
+            instructions[:] = [instructions[i] for i in self.order
+                               if instructions[i] is not None]
+        return len(self.merged)
+
+class RoundCounter(Merger):
+    """ Dependency analysis for estimating the number of rounds of a
+    block without changing it. """
+    def warn_about_mem(self, long_vector=False):
+        pass
+
+    def n_rounds(self):
+        return len(set(self.depths[n] for n in self.open_nodes))
+
+# blocks smaller than this are merged in the main process
+min_parallel_merge = 1000
+
+def plan_merges(blocks, options, merge_classes, jobs):
+    """ Run :py:class:`MergePlanner` on blocks in worker processes.
+
+    :returns: list of plans for :py:class:`MergePlan` or :py:obj:`None`
+      if worker processes are not available
+    """
+    import multiprocessing
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+    global planning
+    planning = blocks, options, merge_classes
+    sys.stdout.flush()
+    try:
+        with context.Pool(min(jobs, len(blocks))) as pool:
+            return pool.map(plan_merge, range(len(blocks)), chunksize=1)
+    finally:
+        planning = None
+
+def plan_merge(i):
+    blocks, options, merge_classes = planning
+    block = blocks[i]
+    merger = MergePlanner(block, options, merge_classes)
+    if options.dead_code_elimination:
+        merger.eliminate_dead_code()
+    if options.merge_opens and block.parent.merge_opens and \
+       block.instructions:
+        merger.longest_paths_merge()
+    return merger.get_plan()
+
 class RegintOptimizer:
+    """ Constant propagation within a list of instructions. Operations
+    on integer and clear registers with operands known at compile time
+    are replaced by loading the result, and operations with one known
+    clear operand use the variant with an immediate value. """
+
+    clear_types = (RegType.ClearModp, RegType.ClearGF2N)
+
     def __init__(self):
         self.cache = util.dict_by_id()
         self.offset_cache = util.dict_by_id()
@@ -784,9 +1046,113 @@ class RegintOptimizer:
         if (new_base.i, new_offset) not in self.rev_offset_cache:
             self.rev_offset_cache[new_base.i, new_offset] = res
 
+    def value(self, arg):
+        """ Known value of register or immediate, :py:obj:`None` otherwise. """
+        if isinstance(arg, int):
+            return arg
+        elif arg in self.cache:
+            return self.cache[arg]
+
+    @staticmethod
+    def fold(inst, a, b):
+        """ Result of clear operation or :py:obj:`None` if unknown. """
+        if inst.is_gf2n():
+            # addition is XOR, multiplication depends on the field
+            if a < 0 or b < 0:
+                return
+            if isinstance(inst, (addc_class, addci_class, subc_class,
+                                 subci_class, subcfi_class, xorc_class,
+                                 xorci_class)):
+                return a ^ b
+            if isinstance(inst, (andc_class, andci_class)):
+                return a & b
+            if isinstance(inst, (orc_class, orci_class)):
+                return a | b
+            return
+        if isinstance(inst, (addc_class, addci_class)):
+            return a + b
+        if isinstance(inst, (subc_class, subci_class)):
+            return a - b
+        if isinstance(inst, subcfi_class):
+            return b - a
+        if isinstance(inst, (mulc_class, mulci_class)):
+            return a * b
+        if isinstance(inst, (shlc_class, shlci_class)):
+            if 0 <= b < 32:
+                return a << b
+            return
+        # remaining operations depend on the representation of
+        # negative values
+        if a < 0 or b < 0:
+            return
+        if isinstance(inst, (shrc_class, shrci_class)):
+            return a >> b
+        if isinstance(inst, (andc_class, andci_class)):
+            return a & b
+        if isinstance(inst, (orc_class, orci_class)):
+            return a | b
+        if isinstance(inst, (xorc_class, xorci_class)):
+            return a ^ b
+        if b and isinstance(inst, floordivc_class):
+            return a // b
+        if b and isinstance(inst, (modc_class, modci_class)):
+            return a % b
+
+    @staticmethod
+    def new(inst, modp, gf2n, *args):
+        return (gf2n if inst.is_gf2n() else modp)(*args, add_to_prog=False)
+
+    def optimize_clear(self, inst):
+        """ Fold or use immediate operand for clear operation. """
+        res, a, b = inst.args
+        x, y = self.value(a), self.value(b)
+        if x is not None and y is not None:
+            value = self.fold(inst, x, y)
+            if value is not None and abs(value) < 2 ** 31:
+                self.cache[res] = value
+                return self.new(inst, ldi, gldi, res, value)
+        elif isinstance(b, int):
+            return
+        elif isinstance(inst, (addc_class, mulc_class)):
+            modp, gf2n = (addci, gaddci) if isinstance(inst, addc_class) \
+                else (mulci, gmulci)
+            if x is not None and abs(x) < 2 ** 31:
+                return self.new(inst, modp, gf2n, res, b, x)
+            if y is not None and abs(y) < 2 ** 31:
+                return self.new(inst, modp, gf2n, res, a, y)
+        elif isinstance(inst, subc_class):
+            if x is not None and abs(x) < 2 ** 31:
+                return self.new(inst, subcfi, gsubcfi, res, b, x)
+            if y is not None and abs(y) < 2 ** 31:
+                return self.new(inst, subci, gsubci, res, a, y)
+
+    def optimize_mixed(self, inst):
+        """ Use immediate operand for operation of secret and clear
+        value. """
+        res, a, b = inst.args
+        if isinstance(inst, submr_class):
+            value = self.value(a)
+            if value is not None and abs(value) < 2 ** 31:
+                return self.new(inst, subsfi, gsubsfi, res, b, value)
+            return
+        value = self.value(b)
+        if value is None or abs(value) >= 2 ** 31:
+            return
+        if isinstance(inst, addm_class):
+            return self.new(inst, addsi, gaddsi, res, a, value)
+        if isinstance(inst, subml_class):
+            return self.new(inst, subsi, gsubsi, res, a, value)
+        if isinstance(inst, mulm_class):
+            if value == 0:
+                return self.new(inst, ldsi, gldsi, res, 0)
+            return self.new(inst, mulsi, gmulsi, res, a, value)
+
     def run(self, instructions, program):
         for i, inst in enumerate(instructions):
-            if isinstance(inst, ldint_class):
+            # registers whose value might change without being known
+            overwritten = [reg for reg in inst.get_def() if reg in self.cache
+                           and not isinstance(inst, (ldint_class, ldi_class))]
+            if isinstance(inst, (ldint_class, ldi_class)):
                 self.cache[inst.args[0]] = inst.args[1]
             elif isinstance(inst, incint):
                 if inst.args[2] == 1 and inst.args[3] == 1 and \
@@ -802,6 +1168,7 @@ class RegintOptimizer:
                         self.cache[inst.args[0]] = res
                         instructions[i] = ldint(inst.args[0], res,
                                                 add_to_prog=False)
+                        continue
                 elif isinstance(inst, addint_class):
                     def f(base, delta_reg):
                         delta = self.cache[delta_reg]
@@ -843,19 +1210,246 @@ class RegintOptimizer:
                     if abs(res) < 2 ** 31:
                         instructions[i] = ldi(inst.args[0], res,
                                               add_to_prog=False)
-            elif isinstance(inst, mulm_class):
-                if inst.args[2] in self.cache:
-                    op = self.cache[inst.args[2]]
-                    if op == 0:
-                        instructions[i] = ldsi(inst.args[0], 0,
-                                               add_to_prog=False)
+                    continue
+            elif isinstance(inst, convmodp_class):
+                res = self.value(inst.args[1])
+                n = inst.args[2]
+                # the virtual machine reduces modulo 2^n for n < 64
+                # and uses unsigned conversion for n == 0
+                if res is not None and abs(res) < 2 ** 31 and \
+                   (n == 64 or 1 < n and 0 <= res < 2 ** (n - 1)):
+                    self.cache[inst.args[0]] = res
+                    instructions[i] = ldint(inst.args[0], res,
+                                            add_to_prog=False)
+                    continue
+            elif isinstance(inst, (AddBase, SubBase, MulBase, ClearImmediate,
+                                   andc_class, orc_class, xorc_class,
+                                   shlc_class, shrc_class, floordivc_class,
+                                   modc_class)) and len(inst.args) == 3:
+                if inst.args[0].reg_type in self.clear_types:
+                    new = self.optimize_clear(inst)
+                else:
+                    new = self.optimize_mixed(inst)
+                if new is not None:
+                    instructions[i] = new
+                    if isinstance(new, ldi_class):
+                        continue
             elif isinstance(inst, (crash, cond_print_str, cond_print_plain)):
                 if inst.args[0] in self.cache:
                     cond = self.cache[inst.args[0]]
                     if not cond:
                         instructions[i] = None
+            for reg in overwritten:
+                del self.cache[reg]
         pre = len(instructions)
         instructions[:] = list(filter(lambda x: x is not None, instructions))
         post = len(instructions)
         if pre != post and program.options.verbose:
             print('regint optimizer removed %d instructions' % (pre - post))
+
+class CommonSubexpressionEliminator:
+    """ Value numbering within the basic blocks of a tape. Local
+    instructions without side effects that compute the same as an
+    earlier instruction in the same block are removed, and their result
+    is replaced by the earlier one. Memory access is not affected. """
+
+    pure = (AddBase, SubBase, MulBase, ImmediateBase, IntegerInstruction,
+            UnaryComparisonInstruction, ldi_class, ldsi_class, ldint_class,
+            gldi_class, gldsi_class, convint_class, convmodp_class,
+            andc_class, orc_class, xorc_class, notc_class, gnotc_class,
+            gandc_class, gorc_class, gxorc_class, shlc_class, shrc_class,
+            divc_class, floordivc_class, modc_class, legendrec_class)
+    commutative = (addc_class, adds_class, mulc_class, addint_class,
+                   mulint_class, eqc_class, andc_class, orc_class,
+                   xorc_class, gandc_class, gorc_class, gxorc_class)
+
+    def __init__(self, tape):
+        self.tape = tape
+
+    @staticmethod
+    def aliases(reg):
+        """ Identities of registers affected by accessing a register. """
+        res = set((id(reg), id(reg.vectorbase)))
+        res.update(id(x) for x in reg.vector)
+        res.update(id(x) for x in reg.duplicates)
+        return res
+
+    @staticmethod
+    def is_plain(reg):
+        return reg.vectorbase is reg and not reg.vector and \
+            len(reg.duplicates) == 1
+
+    def run(self):
+        """ Process all blocks.
+
+        :returns: number of instructions removed
+        """
+        blocks = self.tape.basicblocks
+        # blocks reading each register (-1 for use outside instructions)
+        readers = defaultdict(set)
+        n_writes = defaultdict(lambda: 0)
+        for i, block in enumerate(blocks):
+            for inst in block.instructions:
+                for reg in inst.get_used():
+                    for x in self.aliases(reg):
+                        readers[x].add(i)
+                for reg in inst.get_def():
+                    for x in self.aliases(reg):
+                        n_writes[x] += 1
+            if block.exit_condition is not None:
+                for reg in block.exit_condition.get_used():
+                    for x in self.aliases(reg):
+                        readers[x].add(-1)
+        for reg in self.tape.program.base_addresses:
+            readers[id(reg)].add(-1)
+        count = 0
+        for i, block in enumerate(blocks):
+            count += self.run_block(i, block, readers, n_writes)
+        return count
+
+    def run_block(self, index, block, readers, n_writes):
+        instructions = block.instructions
+        written = defaultdict(lambda: 0)
+        for inst in instructions:
+            for reg in inst.get_def():
+                for x in self.aliases(reg):
+                    written[x] += 1
+        # number of writes so far to distinguish values of a register
+        version = defaultdict(lambda: 0)
+        table = {}
+        replace = {}
+
+        def key(inst):
+            operands = []
+            for arg in inst.args[1:]:
+                if isinstance(arg, Compiler.program.Tape.Register):
+                    operands.append((arg.reg_type, id(arg), sum(
+                        version[x] for x in self.aliases(arg))))
+                else:
+                    operands.append(arg)
+            if isinstance(inst, self.commutative):
+                operands.sort()
+            return type(inst), inst.get_size(), tuple(operands)
+
+        for n, inst in enumerate(instructions):
+            if replace and any(id(arg) in replace for arg in inst.args):
+                inst.args = type(inst.args)(replace.get(id(arg), arg)
+                                            for arg in inst.args)
+            value = None
+            if isinstance(inst, self.pure) and \
+               not isinstance(inst, DoNotEliminateInstruction):
+                value = key(inst)
+            for reg in inst.get_def():
+                for x in self.aliases(reg):
+                    version[x] += 1
+            if value is None:
+                continue
+            res = inst.args[0]
+            if value in table:
+                if self.is_plain(res) and n_writes[id(res)] == 1 and \
+                   readers[id(res)] <= {index}:
+                    replace[id(res)] = table[value]
+                    instructions[n] = None
+            elif self.is_plain(res) and written[id(res)] == 1:
+                table[value] = res
+        pre = len(instructions)
+        instructions[:] = [x for x in instructions if x is not None]
+        return pre - len(instructions)
+
+class BlockJoiner:
+    """ Join basic blocks of a tape where the control flow falls through
+    from one to the next, so that independent communication in both can
+    be merged into the same rounds. This is only done for blocks in the
+    same scope and requirement node consisting of local computation,
+    communication, preprocessing, and memory access at compile-time
+    addresses because the dependency graph keeps the order of these.
+    Blocks with any other instruction such as I/O, timers, or threads
+    are not joined, and neither are blocks that are the target of a
+    jump. """
+
+    movable = CommonSubexpressionEliminator.pure + (
+        movc_class, movs_class, movint_class, DirectMemoryInstruction,
+        asm_open_class, muls_class, mulrs_class, dotprods_class,
+        trunc_pr_class, matmuls, conv2ds, triple_class, bit_class,
+        square_class, inverse_class)
+
+    def __init__(self, tape):
+        self.tape = tape
+
+    def can_move(self, block):
+        """ Whether the order of all instructions in a block is
+        determined by the dependency graph. """
+        for inst in block.instructions:
+            # CISC instructions are not instructions as such
+            cisc = isinstance(inst, Mergeable) and \
+                not isinstance(inst, Instruction)
+            if not (cisc or isinstance(inst, self.movable)) or \
+               isinstance(inst, DoNotEliminateInstruction):
+                return False
+            for reg in itertools.chain(inst.get_def(), inst.get_used()):
+                # linked registers (see Register.update)
+                if len(reg.duplicates) > 1:
+                    return False
+        return True
+
+    def run(self):
+        """ Process the blocks.
+
+        :returns: number of blocks removed
+        """
+        blocks = self.tape.basicblocks
+        targets = set()
+        for block in blocks:
+            targets.add(block.exit_block)
+            if block.previous_block is not None:
+                targets.add(block)
+        targets.update(self.tape.function_basicblocks)
+        mapping = {}
+        res = []
+        movable = None
+        for block in blocks:
+            if res:
+                last = res[-1]
+                can_join = last.exit_condition is None and \
+                    block not in targets and \
+                    last.alloc_pool is block.alloc_pool and \
+                    last.req_node is block.req_node
+            else:
+                can_join = False
+            if can_join:
+                if movable is None:
+                    movable = self.can_move(last)
+                can_join = movable and self.can_move(block)
+            if can_join:
+                self.join(last, block)
+                mapping[block] = last
+            else:
+                res.append(block)
+                movable = None
+        if not mapping:
+            return 0
+        for block in res:
+            if block.scope in mapping:
+                block.scope = mapping[block.scope]
+            if getattr(block, 'sub_block', None) in mapping:
+                block.sub_block = mapping[block.sub_block]
+        blocks[:] = res
+        if self.tape.active_basicblock in mapping:
+            self.tape.active_basicblock = mapping[
+                self.tape.active_basicblock]
+        return len(mapping)
+
+    @staticmethod
+    def join(block, next_block):
+        block.instructions += next_block.instructions
+        block.exit_condition = next_block.exit_condition
+        block.exit_block = next_block.exit_block
+        if next_block in block.children:
+            block.children.remove(next_block)
+        block.children += next_block.children
+        block.n_rounds += next_block.n_rounds
+        block.n_to_merge += next_block.n_to_merge
+        block.rounds = block.rounds + next_block.rounds
+        block.warn_about_mem = block.warn_about_mem or \
+            next_block.warn_about_mem
+        next_block.instructions = []
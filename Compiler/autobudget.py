@@ -0,0 +1,140 @@
+"""
+This module implements the automatic choice of the loop unrolling
+factor activated by ``compile.py --budget auto``. The compiler emits
+the first two iterations of a loop body, measures the number of
+instructions and communication rounds, and extrapolates them to find
+the factor with the lowest estimated cost. The choices are stored in
+``Programs/Budgets/<progname>.json`` and reused by later compilations
+of the same program.
+"""
+
+import collections
+import hashlib
+import json
+import os
+
+from .config import UNROLL_LATENCY, UNROLL_THROUGHPUT, UNROLL_TOLERANCE, \
+    UNROLL_MAX_BUDGET
+from .exceptions import CompilerError
+
+class AutoBudget:
+    """ Chooses and remembers the unrolling factors.
+
+    :param filename: JSON file of earlier choices
+    :param max_budget: maximum number of instructions per unrolled body
+    """
+
+    # number of iterations emitted for measuring
+    n_probes = 2
+
+    def __init__(self, filename, max_budget=UNROLL_MAX_BUDGET):
+        self.filename = filename
+        self.max_budget = max_budget
+        self.occurrences = collections.Counter()
+        self.changed = False
+        try:
+            with open(filename) as f:
+                self.choices = json.load(f)
+        except (OSError, ValueError):
+            self.choices = {}
+
+    @classmethod
+    def from_option(cls, budget, filename):
+        """ Parse ``auto`` or ``auto:<max budget>``. """
+        args = budget.split(':')
+        if args[0] != 'auto' or len(args) > 2:
+            raise CompilerError('invalid budget: %s' % budget)
+        try:
+            return cls(filename, *(int(x) for x in args[1:]))
+        except ValueError:
+            raise CompilerError('invalid budget: %s' % budget)
+
+    @staticmethod
+    def code_hash(code):
+        """ Short hash of the bytecode of a function including nested
+        functions, so that changing the body invalidates the choice. """
+        h = hashlib.sha256()
+        def add(code):
+            h.update(code.co_code)
+            h.update(repr(code.co_names).encode())
+            for const in code.co_consts:
+                if hasattr(const, 'co_code'):
+                    add(const)
+                elif isinstance(const, frozenset):
+                    # order depends on hash randomization
+                    h.update(repr(sorted(map(repr, const))).encode())
+                else:
+                    h.update(repr(const).encode())
+        add(code)
+        return h.hexdigest()[:8]
+
+    def key(self, loop_body, n_loops, budget):
+        """ Identify a loop by the location and a hash of the body,
+        the number of iterations, the budget, and the number of earlier
+        loops with the same. Changes in functions called by the body
+        aren't covered. """
+        code = loop_body.__code__
+        key = '%s:%d:%s:%s:%d' % (os.path.basename(code.co_filename),
+                                  code.co_firstlineno, self.code_hash(code),
+                                  n_loops if isinstance(n_loops, int) \
+                                  else 'regint', budget)
+        self.occurrences[key] += 1
+        return '%s#%d' % (key, self.occurrences[key])
+
+    def get(self, key):
+        """ Unrolling factor chosen earlier or :py:obj:`None`. """
+        res = self.choices.get(key)
+        if res is not None:
+            print('Unrolling loop %s %d times (stored)' % (key, res))
+        return res
+
+    @staticmethod
+    def measure(block, program):
+        """ Number of instructions and rounds of a block. """
+        from .allocator import RoundCounter
+        counter = RoundCounter(block, program.options,
+                               tuple(program.to_merge))
+        return len(block), counter.n_rounds()
+
+    def choose(self, key, probes, n_loops, budget):
+        """ Choose unrolling factor.
+
+        :param key: loop identifier from :py:func:`key`
+        :param probes: results of :py:func:`measure` after each of the
+          first iterations
+        :param n_loops: number of iterations or :py:obj:`None` if unknown
+        :param budget: maximum number of instructions in unrolled body
+        """
+        (size1, rounds1), (size2, rounds2) = probes
+        size = max(size2 - size1, 1)
+        base_size = max(size1 - size, 0)
+        rounds = max(rounds2 - rounds1, 0)
+        base_rounds = max(rounds1 - rounds, 0)
+        def body(k):
+            if k == 0:
+                return 0
+            return (base_rounds + k * rounds) * UNROLL_LATENCY + \
+                (base_size + k * size) * UNROLL_THROUGHPUT
+        if n_loops is None:
+            cost = lambda k: body(k) / k
+        else:
+            # remaining iterations are executed without loop
+            cost = lambda k: n_loops // k * body(k) + body(n_loops % k)
+        max_unroll = max(self.n_probes, -(-(budget - base_size) // size))
+        if n_loops is not None:
+            max_unroll = max(self.n_probes, min(max_unroll, n_loops))
+        costs = [cost(k) for k in range(self.n_probes, max_unroll + 1)]
+        limit = min(costs) * (1 + UNROLL_TOLERANCE)
+        res = self.n_probes + next(i for i, x in enumerate(costs)
+                                   if x <= limit)
+        print('Unrolling loop %s %d times (estimated cost %g s)' % (
+            key, res, costs[res - self.n_probes]))
+        self.choices[key] = res
+        self.changed = True
+        return res
+
+    def write(self):
+        if self.changed:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename, 'w') as out:
+                json.dump(self.choices, out, indent=1, sort_keys=True)
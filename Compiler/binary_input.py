@@ -0,0 +1,154 @@
+"""
+This module implements the staging of binary input files for
+:py:func:`~Compiler.types._secret_structure.input_tensor_via`. The
+virtual machine reads the raw data in
+``Player-Data/Input-Binary-P<player>-0``, so the format of every
+tensor (offset, NumPy dtype, shape, fixed-point precision, one-hot
+encoding, and SHA-256 hash) is kept in a JSON file next to it. When
+compiling again, tensors matching the existing file are not written
+again, and :py:class:`BinaryInput` allows validating the data and
+reading tensors lazily via memory mapping.
+"""
+
+import hashlib
+import json
+import os
+
+from Compiler.exceptions import CompilerError
+
+class BinaryInput:
+    """ Binary input file with format metadata.
+
+    :param filename: name of data file
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = []
+        try:
+            with open(self.metadata_filename(filename)) as f:
+                metadata = json.load(f)
+            stat = os.stat(filename)
+        except (OSError, ValueError):
+            return
+        # ignore metadata if the data file changed otherwise
+        if [stat.st_size, stat.st_mtime_ns] == \
+           [metadata.get('size'), metadata.get('mtime')]:
+            self.entries = metadata['entries']
+
+    @staticmethod
+    def metadata_filename(filename):
+        return filename + '.json'
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        """ Tensor as read-only memory-mapped NumPy array. """
+        import numpy
+        entry = self.entries[i]
+        if entry['dtype'] is None:
+            raise CompilerError('format of binary input %d unknown' % i)
+        return numpy.memmap(self.filename, dtype=entry['dtype'], mode='r',
+                            offset=entry['offset'],
+                            shape=tuple(entry['shape']))
+
+    def validate(self):
+        """ Check the hash of every tensor.
+
+        :raises: :py:class:`~Compiler.exceptions.CompilerError` if
+          data doesn't match
+        """
+        with open(self.filename, 'rb') as f:
+            for i, entry in enumerate(self.entries):
+                f.seek(entry['offset'])
+                h = hashlib.sha256()
+                left = entry['size']
+                while left:
+                    chunk = f.read(min(left, 2 ** 24))
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    left -= len(chunk)
+                if h.hexdigest() != entry['hash']:
+                    raise CompilerError(
+                        'binary input %d in %s does not match its hash' %
+                        (i, self.filename))
+
+class BinaryInputWriter(BinaryInput):
+    """ Stage tensors in a binary input file. Tensors are compared to
+    the existing content, which is only overwritten from the first
+    difference on.
+
+    :param filename: name of data file
+    """
+    def __init__(self, filename):
+        super(BinaryInputWriter, self).__init__(filename)
+        self.old_entries = self.entries
+        self.entries = []
+        self.offset = 0
+        self.file = None
+        self.n_reused = 0
+
+    def append(self, content, **metadata):
+        """ Append tensor.
+
+        :param content: C-contiguous NumPy array
+        :param metadata: further format information such as
+          fixed-point precision
+        """
+        data = memoryview(content).cast('B')
+        entry = dict(offset=self.offset, size=len(data),
+                     dtype=content.dtype.str, shape=list(content.shape),
+                     hash=hashlib.sha256(data).hexdigest(), **metadata)
+        self.add(entry, data)
+
+    def write(self, data):
+        """ Append raw data without format information. """
+        data = memoryview(data).cast('B')
+        self.add(dict(offset=self.offset, size=len(data), dtype=None,
+                      shape=None, hash=hashlib.sha256(data).hexdigest()),
+                 data)
+
+    def add(self, entry, data):
+        i = len(self.entries)
+        self.entries.append(entry)
+        self.offset += entry['size']
+        if self.file is None and i < len(self.old_entries) and \
+           self.old_entries[i] == entry:
+            self.n_reused += 1
+            return
+        if self.file is None:
+            if i:
+                self.file = open(self.filename, 'r+b')
+                self.file.truncate(entry['offset'])
+                self.file.seek(entry['offset'])
+            else:
+                self.file = open(self.filename, 'wb')
+        self.file.write(data)
+
+    def flush(self):
+        """ Make data available and update metadata. """
+        if self.file is not None:
+            self.file.flush()
+            self.write_metadata()
+
+    def close(self):
+        """ Remove remaining content of the existing file. """
+        if self.file is not None:
+            self.file.close()
+            self.write_metadata()
+        elif self.entries != self.old_entries:
+            # fewer tensors than before
+            os.truncate(self.filename, self.offset)
+            self.write_metadata()
+        if self.n_reused:
+            print('Kept %d of %d tensors in %s' % (
+                self.n_reused, len(self.entries), self.filename))
+
+    def write_metadata(self):
+        stat = os.stat(self.filename)
+        filename = self.metadata_filename(self.filename)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(dict(size=stat.st_size, mtime=stat.st_mtime_ns,
+                           entries=self.entries), f, indent=1)
+        os.replace(filename + '.tmp', filename)
@@ -0,0 +1,380 @@
+"""
+This module implements the on-disk cache used by ``compile.py
+--cache``. Entries are addressed by a hash of everything that
+determines the compiler output, that is, the source file, the compiler
+itself, the options, and the program arguments. The least recently
+used entries are evicted once the cache exceeds its size limit.
+"""
+
+import ast
+import hashlib
+import inspect
+import json
+import marshal
+import os
+import shutil
+import sys
+import types
+
+# options that don't affect the output
+# (the effect of the protocol is covered by the program settings)
+ignored_options = ('cache', 'cache_size', 'clear_cache', 'profile', 'jobs',
+                   'compact_graph', 'profile_compiler', 'verbose',
+                   'execute', 'hostfile')
+
+class CompilationCache:
+    """ Store of schedule, bytecode, and public input files.
+
+    :param directory: directory holding the entries
+    :param max_size: maximum total size in bytes
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    _compiler_hash = None
+
+    @classmethod
+    def compiler_hash(cls):
+        """ Hash of all modules in the compiler package. """
+        if cls._compiler_hash is None:
+            h = hashlib.sha256()
+            root = os.path.dirname(os.path.abspath(__file__))
+            for dirpath, dirnames, filenames in sorted(os.walk(root)):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith('.py'):
+                        path = os.path.join(dirpath, filename)
+                        h.update(os.path.relpath(path, root).encode())
+                        with open(path, 'rb') as f:
+                            h.update(f.read())
+            cls._compiler_hash = h.hexdigest()
+        return cls._compiler_hash
+
+    @classmethod
+    def key(cls, source, name, args, options, settings=None):
+        """ Compute the key of a compilation.
+
+        :param source: content of the source file (bytes)
+        :param name: program name
+        :param args: program arguments
+        :param options: compiler options
+        :param settings: further settings derived from the protocol
+        """
+        h = hashlib.sha256()
+        h.update(source)
+        relevant = dict((x, y) for x, y in vars(options).items()
+                        if x not in ignored_options)
+        h.update(json.dumps(
+            [cls.compiler_hash(), name, list(args), sorted(relevant.items()),
+             settings, os.getenv('PLAYERS'), sys.version_info[:2]],
+            default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def clear(self):
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def load(self, key, destinations=None):
+        """ Copy files of an entry to their original location.
+
+        :param destinations: list of file names to use instead of the
+          original locations
+        :returns: entry metadata or :py:obj:`None` if not found
+        """
+        path = self.path(key)
+        try:
+            with open(os.path.join(path, 'entry.json')) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            for i, filename in enumerate(destinations or entry['files']):
+                shutil.copyfile(os.path.join(path, str(i)), filename)
+        except OSError:
+            return None
+        # mark as recently used
+        os.utime(os.path.join(path, 'entry.json'))
+        return entry
+
+    def store(self, key, files, **metadata):
+        """ Add an entry.
+
+        :param key: key from :py:func:`key`
+        :param files: list of output files
+        :param metadata: JSON-serializable information to store with files
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        os.makedirs(tmp)
+        for i, filename in enumerate(files):
+            shutil.copyfile(filename, os.path.join(tmp, str(i)))
+        metadata['files'] = list(files)
+        with open(os.path.join(tmp, 'entry.json'), 'w') as f:
+            json.dump(metadata, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used entries until within the size
+        limit. """
+        entries = []
+        total = 0
+        for key in os.listdir(self.directory):
+            if key.endswith('.tmp'):
+                continue
+            path = self.path(key)
+            try:
+                mtime = os.path.getmtime(os.path.join(path, 'entry.json'))
+            except OSError:
+                continue
+            size = sum(os.path.getsize(os.path.join(path, x))
+                       for x in os.listdir(path))
+            entries.append((mtime, size, path))
+            total += size
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+class Uncacheable(Exception):
+    pass
+
+def _is_primitive(value):
+    return value is None or isinstance(value, (bool, int, float, str, bytes))
+
+def _fingerprint(function, seen):
+    """ Describe a Python function by its source and everything it
+    refers to. """
+    if function in seen:
+        return function.__qualname__
+    seen.add(function)
+    code = function.__code__
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = marshal.dumps(code).hex()
+    names = set()
+    codes = [code]
+    while codes:
+        c = codes.pop()
+        names.update(c.co_names)
+        codes.extend(x for x in c.co_consts if isinstance(x, types.CodeType))
+    globals_ = [(name, _describe(function.__globals__[name], seen))
+                for name in sorted(names) if name in function.__globals__]
+    closure = []
+    for name, cell in zip(code.co_freevars, function.__closure__ or []):
+        try:
+            closure.append((name, _describe(cell.cell_contents, seen)))
+        except ValueError:
+            closure.append((name, None))
+    return [source, globals_, closure,
+            _describe(function.__defaults__, seen),
+            _describe(function.__kwdefaults__, seen)]
+
+def _describe(value, seen):
+    """ JSON-serializable description of a compile-time value or raise
+    :py:class:`Uncacheable`. """
+    from .program import Program
+    if _is_primitive(value):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        return [type(value).__name__] + [_describe(x, seen) for x in value]
+    if isinstance(value, dict):
+        return ['dict'] + sorted([repr(x), _describe(y, seen)]
+                                 for x, y in value.items())
+    if isinstance(value, types.ModuleType):
+        return 'module ' + value.__name__
+    if isinstance(value, Program):
+        return 'program'
+    module = getattr(value, '__module__', None) or ''
+    if isinstance(value, (type, types.FunctionType,
+                          types.BuiltinFunctionType)):
+        if module.split('.')[0] in ('Compiler', 'builtins'):
+            # class attributes such as the fixed-point precision
+            attributes = sorted((x, repr(y)) for x, y in
+                                vars(value).items() if _is_primitive(y)) \
+                if isinstance(value, type) else []
+            return [module, value.__qualname__, attributes]
+        if isinstance(value, types.FunctionType):
+            return _fingerprint(value, seen)
+        if isinstance(value, type):
+            try:
+                return [value.__qualname__, inspect.getsource(value)]
+            except (OSError, TypeError):
+                raise Uncacheable()
+    # arrays and similar are determined by the memory location
+    address = getattr(value, 'address', None)
+    if module.startswith('Compiler') and isinstance(address, int):
+        return [type(value).__name__, address,
+                getattr(value, 'sizes', getattr(value, 'length', None)),
+                _describe(value.value_type, seen)]
+    raise Uncacheable()
+
+def _memory_state(program):
+    return dict(
+        allocated=sorted([t, n] for t, n in program.allocated_mem.items()),
+        free=sorted([t, sorted(map(list, blocks.by_address.items()))]
+                    for t, blocks in program.free_mem_blocks.items()
+                    if blocks.by_address),
+        blocks=sorted([addr, t, size] for (addr, t), (size, pool) in
+                      program.allocated_mem_blocks.items()),
+        later=sorted([t, sorted(map(list, blocks))]
+                     for t, blocks in program.later_mem_blocks.items()
+                     if blocks))
+
+class _CachedUsage:
+    """ Stand-in for the basic blocks of a restored tape in the
+    requirement tree. """
+
+    def __init__(self, req_num):
+        self.req_num = req_num
+
+    def add_usage(self, req_node):
+        req_node.num += self.req_num
+
+class FunctionCache:
+    """ Store of optimized tapes of
+    :py:class:`~Compiler.library.FunctionTape` for ``compile.py
+    --cache``. This allows reusing them if other parts of a program
+    change. Tapes that create further tapes or change compiler state
+    other than the memory allocation are not stored.
+
+    :param cache: :py:class:`CompilationCache` holding the entries
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def key(self, function, args, type_args, program):
+        """ Compute the key of a function tape or return
+        :py:obj:`None` if the function refers to values that cannot be
+        described.
+
+        :param function: :py:class:`~Compiler.library.FunctionTape`
+        :param args: arguments of the first call
+        :param type_args: run-time argument indices by type
+        :param program: :py:class:`~Compiler.program.Program`
+        """
+        from . import types as ctypes
+        seen = set()
+        try:
+            material = [
+                _fingerprint(function.function, seen),
+                _describe(list(function.compile_args), seen),
+                [_describe(x, seen) if isinstance(x, ctypes._vectorizable)
+                 else None for x in args],
+                sorted([_describe(t, seen), x]
+                       for t, x in type_args.items()),
+                function.single_thread,
+                [_describe(getattr(program, x), seen) for x in (
+                    'bit_length', '_security', 'prime', 'galois_length',
+                    '_use_trunc_pr', 'use_dabit', '_edabit', '_invperm',
+                    '_split', '_square', '_always_raw', '_linear_rounds',
+                    'active', 'cisc_to_function', 'budget',
+                    'n_running_threads')],
+                program.warn_about_mem[-1], bool(program._protect_memory),
+                [_describe(getattr(ctypes, x), seen) for x in (
+                    'sint', 'cint', 'sfix', 'cfix', 'sfloat', 'sgf2n')],
+                _memory_state(program),
+            ]
+        except Uncacheable:
+            print('Cannot cache function tape %s because it refers to '
+                  'values that cannot be described' % function.name)
+            return None
+        return self.cache.key(json.dumps(material).encode(), 'function',
+                              program.args, program.options)
+
+    @staticmethod
+    def snapshot(program):
+        """ State to compare after compiling a tape. The tape
+        counter is not included because temporary tapes for CISC
+        instructions increase it. """
+        return dict(n_tapes=len(program.tapes),
+                    types=dict(program.types),
+                    base_addresses=len(program.base_addresses.content),
+                    public_input=program.public_input_file and
+                    program.public_input_file.tell())
+
+    def store(self, tape, key, before, tape_counter):
+        """ Store tape unless it changed the compiler state.
+
+        :param tape: purged :py:class:`~Compiler.program.Tape`
+        :param key: key from :py:func:`key`
+        :param before: result of :py:func:`snapshot` before compiling
+        :param tape_counter: tape counter before compiling
+        """
+        program = tape.program
+        after = self.snapshot(program)
+        if after != before:
+            print('Not caching function tape %s because it changed %s' % (
+                tape.name, ', '.join(x for x in sorted(after)
+                                     if after[x] != before[x])))
+            return
+        req_num = tape.req_tree.aggregate()
+        self.cache.store(
+            key, [tape.outfile], size=len(tape), hash=tape.hash.hex(),
+            n_tapes_created=program.tape_counter - tape_counter,
+            registers=tape.reg_usage,
+            req=[[repr(x), y] for x, y in req_num.items()],
+            req_bit_length=dict(tape.req_bit_length),
+            relevant_opts=sorted(program.relevant_opts),
+            used_security=program.used_security,
+            always_active=program._always_active,
+            memory=_memory_state(program))
+
+    def restore(self, tape, key):
+        """ Restore tape and compiler state.
+
+        :param tape: new empty :py:class:`~Compiler.program.Tape`
+        :param key: key from :py:func:`key`
+        :returns: whether entry was found
+        """
+        entry = self.cache.load(key, [tape.outfile])
+        if entry is None:
+            return False
+        try:
+            req_num = tape.ReqNum(dict((ast.literal_eval(x), y)
+                                       for x, y in entry['req']))
+        except (ValueError, SyntaxError):
+            return False
+        print('Restored function tape %s from cache' % tape.name)
+        tape.purge()
+        tape.size = entry['size']
+        tape.hash = bytes.fromhex(entry['hash'])
+        tape.reg_usage = entry.get('registers', {})
+        tape.req_num = req_num
+        tape.req_bit_length.update(entry['req_bit_length'])
+        tape.req_tree.add_block(_CachedUsage(req_num))
+        program = tape.program
+        program.relevant_opts.update(entry['relevant_opts'])
+        program.used_security = entry['used_security']
+        program._always_active = entry['always_active']
+        # keep the names of later tapes
+        program.tape_counter += entry.get('n_tapes_created', 0)
+        memory = entry['memory']
+        program.allocated_mem.update(memory['allocated'])
+        program.free_mem_blocks.clear()
+        for t, blocks in memory['free']:
+            allocator = program.free_mem_blocks[t]
+            for addr, size in blocks:
+                allocator.by_address[addr] = size
+                allocator.by_size(size).add(addr)
+        old = program.allocated_mem_blocks
+        new = {}
+        for addr, t, size in memory['blocks']:
+            # blocks allocated by the tape cannot be freed elsewhere
+            new[addr, t] = old.get((addr, t), (size, None))
+        program.allocated_mem_blocks = new
+        program.later_mem_blocks.clear()
+        for t, blocks in memory['later']:
+            program.later_mem_blocks[t] = [tuple(x) for x in blocks]
+        return True
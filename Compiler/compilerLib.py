@@ -2,13 +2,10 @@ import inspect
 import os
 import re
 import sys
-import tempfile
-import subprocess
 from optparse import OptionParser
 
 from Compiler.exceptions import CompilerError
 
-from .GC import types as GC_types
 from .program import Program, defaults
 
 
@@ -102,6 +99,14 @@ class Compiler:
             default=defaults.noreallocate,
             help="don't reallocate",
         )
+        parser.add_option(
+            "--interval-allocation",
+            action="store_true",
+            dest="interval_allocation",
+            default=defaults.interval_allocation,
+            help="allocate registers from live intervals "
+            "(faster for large basic blocks)",
+        )
         parser.add_option(
             "-m",
             "--max-parallel-open",
@@ -117,6 +122,21 @@ class Compiler:
             default=defaults.dead_code_elimination,
             help="eliminate instructions with unused result",
         )
+        parser.add_option(
+            "--join-blocks",
+            action="store_true",
+            dest="join_blocks",
+            default=defaults.join_blocks,
+            help="join basic blocks without jumps between them "
+            "to merge communication rounds across them",
+        )
+        parser.add_option(
+            "--cse",
+            action="store_true",
+            dest="cse",
+            default=defaults.cse,
+            help="eliminate repeated local computation within basic blocks",
+        )
         parser.add_option(
             "-p",
             "--profile",
@@ -124,6 +144,73 @@ class Compiler:
             dest="profile",
             help="profile compilation",
         )
+        parser.add_option(
+            "--compact-graph",
+            action="store_true",
+            dest="compact_graph",
+            default=defaults.compact_graph,
+            help="use less memory for the dependency graph when merging "
+            "at the cost of some compilation time",
+        )
+        parser.add_option(
+            "--max-compiler-memory",
+            dest="max_compiler_memory",
+            default=defaults.max_compiler_memory,
+            help="resident memory in MB from which to use less memory "
+            "by not merging large basic blocks and moving encoded blocks "
+            "to disk",
+        )
+        parser.add_option(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            default=defaults.jobs,
+            help="number of processes for merging basic blocks "
+            "in parallel (default: %d)" % defaults.jobs,
+        )
+        parser.add_option(
+            "--profile-compiler",
+            action="store_true",
+            dest="profile_compiler",
+            default=defaults.profile_compiler,
+            help="report time and memory usage of compilation phases "
+            "in Programs/Profiles/<progname>.json",
+        )
+        parser.add_option(
+            "--requirements-only",
+            action="store_true",
+            dest="requirements_only",
+            default=defaults.requirements_only,
+            help="only determine offline data requirements and write them "
+            "to Programs/Requirements/<progname>.json without producing "
+            "bytecode",
+        )
+        parser.add_option(
+            "--cost-report",
+            dest="cost_report",
+            default=defaults.cost_report,
+            help="estimate rounds and communication per tape and loop for "
+            "protocol family (replicated/shamir/spdz[:<number of parties>])",
+        )
+        parser.add_option(
+            "--cache",
+            action="store_true",
+            dest="cache",
+            help="reuse output of earlier compilation with identical "
+            "source, arguments, options, and compiler",
+        )
+        parser.add_option(
+            "--cache-size",
+            dest="cache_size",
+            default=1024,
+            help="maximum size of compilation cache in MB (default: 1024)",
+        )
+        parser.add_option(
+            "--clear-cache",
+            action="store_true",
+            dest="clear_cache",
+            help="empty compilation cache before compiling",
+        )
         parser.add_option(
             "-s",
             "--stop",
@@ -178,7 +265,8 @@ class Compiler:
             "-b",
             "--budget",
             dest="budget",
-            help="set budget for optimized loop unrolling (default: %d)" % \
+            help="set budget for optimized loop unrolling (default: %d) "
+            "or 'auto[:<maximum>]' for a choice based on a cost model" % \
             defaults.budget,
         )
         parser.add_option(
@@ -316,6 +404,7 @@ class Compiler:
 
     def build_vars(self):
         from . import comparison, floatingpoint, instructions, library, types
+        from .GC import types as GC_types
 
         # add all instructions to the program VARS dictionary
         instr_classes = [
@@ -397,6 +486,15 @@ class Compiler:
         self.prog.sint = self.sint
         self.prog.sfix = self.sfix
 
+        cache = self.get_cache()
+        if cache:
+            with open(self.prog.infile, "rb") as f:
+                key = cache.key(f.read(), self.prog.name, self.args,
+                                self.options, [self.prog._use_trunc_pr,
+                                               self.prog._split])
+            if self.load_from_cache(cache, key):
+                return self.prog
+
         with open(self.prog.infile, "r") as f:
             changed = False
             if self.options.flow_optimization:
@@ -439,6 +537,7 @@ class Compiler:
                             continue
                     output.append(line)
                 if changed:
+                    import tempfile
                     infile = tempfile.NamedTemporaryFile("w+", delete=False)
                     for line in output:
                         infile.write(line)
@@ -451,12 +550,63 @@ class Compiler:
         # make compiler modules directly accessible
         sys.path.insert(0, "%s/Compiler" % self.root)
         # create the tapes
-        exec(compile(infile.read(), infile.name, "exec"), self.VARS)
+        with self.prog.profile("source"):
+            exec(compile(infile.read(), infile.name, "exec"), self.VARS)
 
         if changed and not self.options.debug:
             os.unlink(infile.name)
 
-        return self.finalize_compile()
+        self.finalize_compile()
+        if cache:
+            self.store_in_cache(cache, key)
+        return self.prog
+
+    def get_cache(self):
+        if not (self.options.cache or self.options.clear_cache):
+            return
+        from .cache import CompilationCache
+
+        cache = CompilationCache(
+            self.prog.programs_dir + "/Cache",
+            int(float(self.options.cache_size) * 2 ** 20))
+        if self.options.clear_cache:
+            print("Clearing compilation cache")
+            cache.clear()
+        if self.options.cache and not (self.options.requirements_only or
+                                       self.options.cost_report):
+            if not self.options.asmoutfile:
+                from .cache import FunctionCache
+
+                self.prog.function_cache = FunctionCache(CompilationCache(
+                    cache.path("functions"), cache.max_size))
+            return cache
+
+    def load_from_cache(self, cache, key):
+        entry = cache.load(key)
+        if entry is None:
+            return False
+        print("Found compilation in cache")
+        for filename in entry["files"]:
+            print("Restored", filename)
+        print("Hash:", entry["hash"])
+        if entry["req"]:
+            print("Program requires at most:")
+            for x in entry["req"]:
+                print(x)
+        return True
+
+    def store_in_cache(self, cache, key):
+        prog = self.prog
+        files = [prog.programs_dir + "/Schedules/%s.sch" % prog.name,
+                 prog.programs_dir + "/Schedules/%s.json" % prog.name]
+        files += [tape.outfile for tape in prog.tapes]
+        if self.options.asmoutfile:
+            files += [self.options.asmoutfile + "-" + tape.name
+                      for tape in prog.tapes]
+        if prog.public_input_file is not None:
+            files.append(prog.public_input_file.name)
+        req = prog.req_num.pretty() if prog.req_num else []
+        cache.store(key, files, hash=prog.hash, req=req)
 
     def register_function(self, name=None):
         """
@@ -491,11 +641,23 @@ class Compiler:
     def finalize_compile(self):
         self.prog.finalize()
 
+        if self.prog.profiler:
+            filename = self.prog.programs_dir + "/Profiles/%s.json" % \
+                self.prog.name
+            self.prog.profiler.write(filename, self.prog.name)
+            self.prog.profiler.print_summary()
+            print("Writing profile to", filename)
+
         if self.prog.req_num:
             print("Program requires at most:")
             for x in self.prog.req_num.pretty():
                 print(x)
 
+        if self.options.cost_report:
+            from .cost_report import print_cost_report
+
+            print_cost_report(self.prog, self.options.cost_report)
+
         if self.prog.verbose:
             print("Program requires:", repr(self.prog.req_num))
             print("Cost:", 0 if self.prog.req_num is None else self.prog.req_num.cost())
@@ -525,6 +687,7 @@ class Compiler:
         executable = self.executable_from_protocol(self.options.execute)
         if not os.path.exists("%s/%s" % (self.root, executable)):
             print("Creating binary for virtual machine...")
+            import subprocess
             try:
                 subprocess.run(["make", executable], check=True, cwd=self.root)
             except:
@@ -563,6 +726,21 @@ class Compiler:
         connections = [Connection(hostname) for hostname in hostnames]
         print("Setting up players...")
 
+        def put_if_changed(connection, filename, dest):
+            # skip files whose hash matches the last copy on the host
+            sidecar = filename + ".sha256"
+            if os.path.exists(sidecar):
+                with open(sidecar) as f:
+                    digest = f.read()
+                remote = connection.run(
+                    "cat %s/%s" % (dest, os.path.basename(sidecar)),
+                    warn=True, hide=True)
+                if remote.ok and remote.stdout == digest:
+                    return
+            connection.put(filename, dest)
+            if os.path.exists(sidecar):
+                connection.put(sidecar, dest)
+
         def run(i):
             dest = destinations[i]
             connection = connections[i]
@@ -573,11 +751,13 @@ class Compiler:
             connection.put("%s/static/%s" % (self.root, vm), dest)
             # program
             dest += "/"
-            connection.put("Programs/Schedules/%s.sch" % self.prog.name,
+            put_if_changed(connection,
+                           "Programs/Schedules/%s.sch" % self.prog.name,
                            dest + "Programs/Schedules")
             for filename in glob.glob(
                     "Programs/Bytecode/%s-*.bc" % self.prog.name):
-                connection.put(filename, dest + "Programs/Bytecode")
+                put_if_changed(connection, filename,
+                               dest + "Programs/Bytecode")
             # inputs
             for filename in glob.glob("Player-Data/Input*-P%d-*" % i):
                 connection.put(filename, dest + "Player-Data")
@@ -42,6 +42,15 @@ COST = defaultdict(lambda: defaultdict(lambda: 0),
          }
 })
 
+# cost model for automatic loop unrolling (--budget auto)
+# time per communication round and per instruction in seconds
+UNROLL_LATENCY = 1e-3
+UNROLL_THROUGHPUT = 1e-7
+# accept this relative cost increase for less unrolling
+UNROLL_TOLERANCE = 0.01
+# maximum number of instructions per unrolled loop body
+UNROLL_MAX_BUDGET = 100000
+
 
 try:
     from config_mine import *
@@ -0,0 +1,166 @@
+"""
+This module implements the estimate of the communication cost output
+by ``compile.py --cost-report``. It uses the requirement tree of every
+tape, which already accounts for the number of loop iterations where
+known, to derive the number of rounds and the number of bytes sent
+per party in the online phase for a family of protocols.
+"""
+
+import math
+
+from .exceptions import CompilerError
+from .program import Tape
+
+class CostModel:
+    """ Number of elements sent per party for each operation.
+
+    :param name: protocol family
+    :param n_parties: number of parties
+    """
+
+    # family: (description, default number of parties, elements sent
+    # per party per open, multiplication, square, and input,
+    # function of matrix dimensions for multiplication)
+    families = {
+        'replicated': ('replicated secret sharing', 3,
+                       lambda n: (1, 1, 1, (n - 1) / n),
+                       lambda n, a, b, c: a * c),
+        'shamir': ('Shamir secret sharing', 3,
+                   lambda n: (n - 1, n - 1, n - 1, (n - 1) / n),
+                   lambda n, a, b, c: a * c * (n - 1)),
+        'spdz': ('SPDZ-style secret sharing with preprocessing', 2,
+                 lambda n: (n - 1, 2 * (n - 1), n - 1, (n - 1) / n),
+                 lambda n, a, b, c: (a * b + b * c) * (n - 1)),
+    }
+
+    def __init__(self, name, n_parties=None):
+        if name not in self.families:
+            raise CompilerError('unknown protocol family: %s (use one of %s)'
+                                % (name, ', '.join(sorted(self.families))))
+        self.description, default, per_op, self.per_matmul = \
+            self.families[name]
+        self.n_parties = n_parties or default
+        if name == 'replicated' and self.n_parties != 3:
+            raise CompilerError('replicated secret sharing requires three '
+                                'parties')
+        if self.n_parties < 2:
+            raise CompilerError('need at least two parties')
+        self.per_op = dict(zip(('open', 'triple', 'square', 'input'),
+                               per_op(self.n_parties)))
+        # GF(2^n) triples for binary computation
+        self.per_op['bittriple'] = self.per_op['bitgf2ntriple'] = \
+            self.per_op['triple']
+
+    @classmethod
+    def from_option(cls, option):
+        """ Parse ``<family>`` or ``<family>:<number of parties>``. """
+        args = option.split(':')
+        try:
+            n_parties = int(args[1]) if len(args) == 2 else None
+        except ValueError:
+            n_parties = None
+        if len(args) > 2 or (len(args) == 2 and n_parties is None):
+            raise CompilerError('invalid cost report option: %s' % option)
+        return cls(args[0], n_parties)
+
+    def set_sizes(self, program):
+        """ Element sizes in bytes depending on the domain. """
+        if program.options.ring:
+            modp = math.ceil(int(program.options.ring) / 8)
+        else:
+            if program.prime:
+                bits = program.prime.bit_length()
+            else:
+                bits = max([program.bit_length + program.security] + [
+                    tape.req_bit_length["p"] for tape in program.tapes])
+            # the virtual machine uses 64-bit words
+            modp = 8 * math.ceil(bits / 64)
+        self.sizes = dict(modp=modp, gf2n=16, bit=1 / 8)
+
+    def volume(self, req_num):
+        """ Estimated bytes sent per party. """
+        res = 0
+        for req, num in req_num.items():
+            if req[0] == 'matmul':
+                res += num * self.per_matmul(self.n_parties, *req[1]) * \
+                    self.sizes['modp']
+            elif req[0] in self.sizes and req[1] in self.per_op:
+                res += num * self.per_op[req[1]] * self.sizes[req[0]]
+        return res
+
+def format_number(x):
+    if x == float('inf'):
+        return 'unknown'
+    return '%d' % x
+
+def format_bytes(x):
+    if x == float('inf'):
+        return 'unknown'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if x < 1000:
+            break
+        x /= 1000
+    return '%.3g %s' % (x, unit)
+
+def repetitions(child):
+    """ Number of executions of scope (infinity if unknown) or
+    :py:obj:`None` if not a loop. """
+    probe = Tape.ReqNum({('all', 'round'): 1})
+    try:
+        res = child.aggregator([probe] * len(child.nodes))
+    except (AttributeError, TypeError, IndexError):
+        return None
+    if res['all', 'round'] != 1:
+        return res['all', 'round']
+
+def print_cost_report(program, option):
+    """ Output rounds and communication per tape and loop.
+
+    :param program: :py:class:`~Compiler.program.Program` after
+      compilation
+    :param option: argument of ``--cost-report``
+    """
+    model = CostModel.from_option(option)
+    model.set_sizes(program)
+    print('Cost estimate for %s with %d parties (%g bytes per integer):' %
+          (model.description, model.n_parties, model.sizes['modp']))
+
+    def describe(req_num):
+        return '%s rounds, %s sent per party' % (
+            format_number(req_num['all', 'round']),
+            format_bytes(model.volume(req_num)))
+
+    def free(req_num):
+        return not (req_num['all', 'round'] or model.volume(req_num))
+
+    tape_trees = set(tape.req_tree for tape in program.tapes)
+
+    def walk(node, indent):
+        # avoid invalidating the aggregation by using _children
+        for child in node._children:
+            if isinstance(child, Tape.ReqNode):
+                # the callee's aggregate, omitted if without communication
+                req_num = child.aggregate()
+                if not free(req_num):
+                    print('%s%s %s: %s' % (
+                        indent,
+                        'thread' if child in tape_trees else 'function',
+                        child.name, describe(req_num)))
+                continue
+            n_reps = repetitions(child)
+            for sub in child.nodes:
+                req_num = sub.aggregate()
+                if free(req_num):
+                    continue
+                if n_reps is None:
+                    print('%s%s: %s' % (indent, sub.name, describe(req_num)))
+                else:
+                    print('%s%s: %s repetitions, %s per repetition' % (
+                        indent, sub.name, format_number(n_reps),
+                        describe(req_num)))
+                walk(sub, indent + '  ')
+
+    for tape in program.tapes:
+        print('Tape %s: %s' % (tape.name, describe(tape.req_tree.aggregate())))
+        walk(tape.req_tree, '  ')
+    print('Preprocessing and checks are not included.')
@@ -1,5 +1,7 @@
 import heapq
 import collections
+import itertools
+from array import array
 from Compiler.exceptions import *
 
 class GraphError(CompilerError):
@@ -101,11 +103,277 @@ class SparseDiGraph(object):
     def degree(self, i):
         return len(self.succ[i])
 
+    def is_source(self, i):
+        return not self.pred[i]
+
+    def merge_nodes(self, i, j):
+        """ Merge node j into i, removing node j """
+        if j in self[i]:
+            self.remove_edge(i, j)
+        if i in self[j]:
+            self.remove_edge(j, i)
+        self.add_edges_from(list(zip(itertools.cycle([i]), self[j], [self.weights[(j,k)] for k in self[j]])))
+        self.add_edges_from(list(zip(self.pred[j], itertools.cycle([i]), [self.weights[(k,j)] for k in self.pred[j]])))
+        self.remove_node(j)
+
+class CompactDiGraph(object):
+    """ Directed graph using arrays for large numbers of nodes and edges.
+
+    Edges are appended to a buffer, which is converted to compressed
+    sparse rows for successors and predecessors on the first
+    query. Later changes are kept separately for the nodes concerned.
+    Successors are listed in the order the edges were added, and the
+    behavior otherwise follows :py:class:`SparseDiGraph` including
+    the successors kept by removed nodes, so the results of
+    :py:func:`topological_sort` are the same. Edge weights are not
+    supported.
+    """
+    class Predecessors(object):
+        def __init__(self, graph):
+            self.graph = graph
+
+        def __getitem__(self, i):
+            return self.graph.predecessors(i)
+
+    def __init__(self, max_nodes, default_attributes=None):
+        """ max_nodes: maximum no of nodes
+        default_attributes: dict of node attributes and default values """
+        if default_attributes is None:
+            default_attributes = { 'merges': None }
+        self.default_attributes = default_attributes
+        self.n = max_nodes
+        self.attributes = {}
+        self.src = array('i')
+        self.dst = array('i')
+        self.has_pred = bytearray(max_nodes)
+        self.alive = bytearray(b'\x01') * max_nodes
+        self.succ_start = None
+        self.changed_succ = {}
+        self.changed_pred = {}
+        self.succ_index = {}
+        self.removed_succ = {}
+        self.pred = self.Predecessors(self)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        """ Get list of the neighbours of node i """
+        self.compact()
+        alive = self.alive
+        if not alive[i]:
+            return self.removed_succ.get(i, [])
+        if i in self.changed_succ:
+            succ = self.changed_succ[i]
+        else:
+            succ = self.succ[self.succ_start[i]:self.succ_start[i + 1]]
+        return [j for j in succ if alive[j]]
+
+    def __contains__(self, i):
+        return i >= 0 and i < self.n
+
+    def predecessors(self, i):
+        self.compact()
+        alive = self.alive
+        if not alive[i]:
+            return []
+        if i in self.changed_pred:
+            pred = self.changed_pred[i]
+        else:
+            pred = self.pred_nodes[self.pred_start[i]:self.pred_start[i + 1]]
+        return [j for j in pred if alive[j]]
+
+    def compact(self):
+        """ Convert the edge buffer to compressed sparse rows. """
+        if self.succ_start is not None:
+            return
+        n = self.n
+        src, dst = self.src, self.dst
+        self.src = self.dst = None
+        start, succ = _group(src, dst, n)
+        del src, dst
+        # remove duplicate edges, keeping the first
+        mark = array('i', [-1]) * n
+        self.succ_start = succ_start = array('i', [0]) * (n + 1)
+        self.succ = unique = array('i')
+        for i in range(n):
+            for j in succ[start[i]:start[i + 1]]:
+                if mark[j] != i:
+                    mark[j] = i
+                    unique.append(j)
+            succ_start[i + 1] = len(unique)
+        del start, succ, mark
+        self.pred_start = pred_start = array('i', [0]) * (n + 1)
+        for j in unique:
+            pred_start[j + 1] += 1
+        for i in range(n):
+            pred_start[i + 1] += pred_start[i]
+        pos = array('i', pred_start)
+        self.pred_nodes = pred = array('i', [0]) * len(unique)
+        for i in range(n):
+            for j in unique[succ_start[i]:succ_start[i + 1]]:
+                pred[pos[j]] = i
+                pos[j] += 1
+        self.has_pred = None
+
+    def changed(self, i):
+        if i not in self.changed_succ:
+            self.changed_succ[i] = array('i', self[i])
+        return self.changed_succ[i]
+
+    def changed_predecessors(self, i):
+        if i not in self.changed_pred:
+            self.changed_pred[i] = array('i', self.predecessors(i))
+        return self.changed_pred[i]
+
+    def has_edge(self, i, j):
+        if i in self.succ_index:
+            return j in self.succ_index[i]
+        elif i in self.changed_succ:
+            return j in self.changed_succ[i]
+        else:
+            return j in self.succ[self.succ_start[i]:self.succ_start[i + 1]]
+
+    def add_node(self, i, **attr):
+        if i >= self.n:
+            raise CompilerError('Cannot add node %d to graph of size %d' % (i, self.n))
+        for a,value in list(attr.items()):
+            self.set_attr(i, a, value)
+
+    def set_attr(self, i, attr, value):
+        if attr in self.default_attributes:
+            self.attributes.setdefault(i, {})[attr] = value
+        else:
+            raise CompilerError('Invalid attribute %s for graph node' % attr)
+
+    def get_attr(self, i, attr):
+        if i in self.attributes and attr in self.attributes[i]:
+            return self.attributes[i][attr]
+        return self.default_attributes[attr]
+
+    def remove_node(self, i):
+        """ Remove node i and all its edges """
+        succ = self[i]
+        if succ:
+            self.removed_succ[i] = array('i', succ)
+        self.changed_succ.pop(i, None)
+        self.changed_pred.pop(i, None)
+        self.succ_index.pop(i, None)
+        self.attributes.pop(i, None)
+        self.alive[i] = 0
+
+    def add_edge(self, i, j, weight=1):
+        if weight != 1:
+            raise GraphError('Edge weights not supported')
+        if self.succ_start is None:
+            self.src.append(i)
+            self.dst.append(j)
+            self.has_pred[j] = 1
+        elif self.alive[i] and self.alive[j]:
+            if self.has_edge(i, j):
+                return
+            succ = self.changed(i)
+            succ.append(j)
+            # linear search is slow for nodes with many successors
+            if i in self.succ_index:
+                self.succ_index[i].add(j)
+            elif len(succ) > 32:
+                self.succ_index[i] = set(succ)
+            self.changed_predecessors(j).append(i)
+        else:
+            raise GraphError('Cannot add edge to removed node')
+
+    def add_edges_from(self, tuples):
+        for edge in tuples:
+            self.add_edge(*edge)
+
+    def remove_edge(self, i, j):
+        self.compact()
+        self.changed(i).remove(j)
+        if i in self.succ_index:
+            self.succ_index[i].remove(j)
+        self.changed_predecessors(j).remove(i)
+
+    def remove_edges_from(self, pairs):
+        for i,j in pairs:
+            self.remove_edge(i, j)
+
+    def degree(self, i):
+        return len(self[i])
+
+    def is_source(self, i):
+        if self.succ_start is None:
+            return not self.has_pred[i]
+        return not self.predecessors(i)
+
+    def csr(self):
+        """ Successors as compressed sparse rows in the order of
+        :py:meth:`__getitem__`.
+
+        :returns: tuple of start offsets and successors
+        """
+        self.compact()
+        if not (self.changed_succ or self.removed_succ) and \
+           all(self.alive):
+            return self.succ_start, self.succ
+        alive = self.alive
+        succ_start = self.succ_start
+        all_succ = self.succ
+        changed_succ = self.changed_succ
+        removed_succ = self.removed_succ
+        start = array('i', [0]) * (self.n + 1)
+        succ = array('i')
+        for i in range(self.n):
+            if not alive[i]:
+                succ.extend(removed_succ.get(i, ()))
+            else:
+                if i in changed_succ:
+                    row = changed_succ[i]
+                else:
+                    row = all_succ[succ_start[i]:succ_start[i + 1]]
+                succ.extend([j for j in row if alive[j]])
+            start[i + 1] = len(succ)
+        return start, succ
+
+    def merge_nodes(self, i, j):
+        """ Merge node j into i, removing node j """
+        for k in self[j]:
+            if k != i:
+                self.add_edge(i, k)
+        for k in self.predecessors(j):
+            if k != i:
+                self.add_edge(k, i)
+        self.remove_node(j)
+
+def _group(keys, values, n):
+    """ Stable counting sort of values by keys in range(n).
+
+    :returns: tuple of start offsets and sorted values
+    """
+    start = array('i', [0]) * (n + 1)
+    for k in keys:
+        start[k + 1] += 1
+    for i in range(n):
+        start[i + 1] += start[i]
+    pos = array('i', start)
+    res = array('i', [0]) * len(values)
+    for k, v in zip(keys, values):
+        res[pos[k]] = v
+        pos[k] += 1
+    return start, res
+
+
+# number of nodes from which topological_sort uses compressed sparse
+# rows of a CompactDiGraph
+csr_threshold = 10000
 
 def topological_sort(G, nbunch=None, pref=None):
-    seen={}
+    if nbunch is None and pref is None and len(G) >= csr_threshold and \
+       isinstance(G, CompactDiGraph):
+        return csr_topological_sort(G)
+    seen=bytearray(len(G))
     order_explored=[] # provide order and 
-    explored={}       # fast search without more general priorityDictionary
+    explored=bytearray(len(G)) # fast search
     
     if pref is None:
         def get_children(node):
@@ -126,20 +394,20 @@ def topological_sort(G, nbunch=None, pref=None):
     if nbunch is None:
         nbunch = reversed(list(range(len(G))))
     for v in nbunch:     # process all vertices in G
-        if v in explored: 
+        if explored[v]:
             continue
         fringe=[v]   # nodes yet to look at
         while fringe:
             w=fringe[-1]  # depth first search
-            if w in explored: # already looked down this branch
+            if explored[w]: # already looked down this branch
                 fringe.pop()
                 continue
             seen[w]=1     # mark as seen
             # Check successors for cycles and for new nodes
             new_nodes=[]
             for n in get_children(w):
-                if n not in explored:
-                    if n in seen: #CYCLE !!
+                if not explored[n]:
+                    if seen[n]: #CYCLE !!
                         raise GraphError("Graph contains a cycle at %d (%s,%s)." % \
                                                         (n, G[n], G.pred[n]))
                     new_nodes.append(n)
@@ -153,6 +421,48 @@ def topological_sort(G, nbunch=None, pref=None):
     order_explored.reverse() # reverse order explored
     return order_explored
 
+def csr_topological_sort(G):
+    """ Same as :py:func:`topological_sort` without arguments but
+    traversing the successors of a :py:class:`CompactDiGraph` as
+    compressed sparse rows instead of creating a list of successors
+    every time a node is visited. Nodes are finished without scanning
+    their successors a second time, which results in the same order
+    because all successors pushed on top of a node have been explored
+    when it is back on top. """
+    start, succ = G.csr()
+    n_nodes = len(G)
+    seen = bytearray(n_nodes)
+    explored = bytearray(n_nodes)
+    order_explored = []
+    for v in range(n_nodes - 1, -1, -1):
+        if explored[v]:
+            continue
+        fringe = [v]
+        while fringe:
+            w = fringe[-1]
+            if explored[w]:
+                fringe.pop()
+            elif seen[w]:
+                explored[w] = 1
+                order_explored.append(w)
+                fringe.pop()
+            else:
+                seen[w] = 1
+                size = len(fringe)
+                for n in succ[start[w]:start[w + 1]]:
+                    if not explored[n]:
+                        if seen[n]:
+                            raise GraphError(
+                                "Graph contains a cycle at %d (%s,%s)." % \
+                                (n, G[n], G.pred[n]))
+                        fringe.append(n)
+                if len(fringe) == size:
+                    explored[w] = 1
+                    order_explored.append(w)
+                    fringe.pop()
+    order_explored.reverse()
+    return order_explored
+
 def dag_shortest_paths(G, source):
     top_order = topological_sort(G)
     dist = [None] * len(G)
@@ -6,6 +6,7 @@ import functools
 import copy
 import sys
 import struct
+import collections
 from Compiler.exceptions import *
 from Compiler.config import *
 from Compiler import util
@@ -546,6 +547,8 @@ def cisc(function, n_outputs=1):
                     res = [arg.new() for arg in args[:n_outputs]]
                     self.new_instructions(size,
                                           res + [arg.load() for arg in args[n_outputs:]])
+                    # not merged as expanded after merging
+                    program.curr_block.n_rounds += self.n_rounds
                     for reg, arg in zip(res, args):
                         arg.store(reg)
                 f.name =  '_'.join(['%s(%d)' % (function.__name__, size)] +
@@ -596,6 +599,8 @@ def cisc(function, n_outputs=1):
             if program.cisc_to_function and \
                (program.curr_tape.singular or program.n_running_threads):
                 self.expand_to_function(size, new_regs)
+                # replaced by the rounds in the function
+                program.curr_block.n_rounds -= 1
             else:
                 self.new_instructions(size, new_regs)
                 program.curr_block.n_rounds += self.n_rounds - 1
@@ -1075,11 +1080,12 @@ class Instruction(object):
 class ParsedInstruction:
     reverse_opcodes = {}
 
-    def __init__(self, f):
-        cls = type(self)
-        from Compiler import instructions
-        from Compiler.GC import instructions as gc_inst
+    @classmethod
+    def get_reverse_opcodes(cls):
+        """ Dictionary from opcodes to instruction classes. """
         if not cls.reverse_opcodes:
+            from Compiler import instructions
+            from Compiler.GC import instructions as gc_inst
             for module in instructions, gc_inst:
                 for x, y in inspect.getmodule(module).__dict__.items():
                     if inspect.isclass(y) and y.__name__[0] != 'v':
@@ -1087,11 +1093,15 @@ class ParsedInstruction:
                             cls.reverse_opcodes[y.code] = y
                         except AttributeError:
                             pass
+        return cls.reverse_opcodes
+
+    def __init__(self, f):
+        cls = type(self)
         read = lambda: struct.unpack('>I', f.read(4))[0]
         full_code = struct.unpack('>Q', f.read(8))[0]
         self.code = full_code % (1 << Instruction.code_length)
         self.size = full_code >> Instruction.code_length
-        self.type = cls.reverse_opcodes[self.code]
+        self.type = cls.get_reverse_opcodes()[self.code]
         t = self.type
         name = t.__name__
         try:
@@ -1119,6 +1129,25 @@ class ParsedInstruction:
         for i in range(n_args):
             self.args.append(ArgFormats[next(arg_format)](f))
 
+    @classmethod
+    def from_values(cls, code, size, t, var_args, layout, values):
+        """ Create instruction from the output of
+        :py:meth:`BytecodeDecoder.decode`. """
+        res = cls.__new__(cls)
+        res.code = code
+        res.size = size
+        res.type = t
+        res.var_args = var_args
+        res.args = args = []
+        for arg_type, value in zip(layout.arg_types, values):
+            arg = arg_type.__new__(arg_type)
+            if isinstance(value, str):
+                arg.str = value
+            else:
+                arg.i = value
+            args.append(arg)
+        return res
+
     def __str__(self):
         name = self.type.__name__
         res = name + ' '
@@ -1132,6 +1161,232 @@ class ParsedInstruction:
     def get_usage(self):
         return self.type.get_usage(self.args)
 
+class ArgLayout:
+    """ Argument formats of an instruction with the precompiled
+    :py:class:`struct.Struct` if all arguments have fixed length and
+    the positions of register arguments by type. """
+
+    # order matters because of inheritance
+    struct_codes = ((LongArgFormat, 'q'), (RegisterArgFormat, 'I'),
+                    (IntArgFormat, 'i'), (String, '16s'))
+    codes = {}
+
+    def __init__(self, formats):
+        self.formats = formats
+        self.arg_types = [ArgFormats[f] for f in formats]
+        codes = [self.struct_code(f) for f in formats]
+        if None in codes:
+            self.fixed = None
+        else:
+            self.fixed = struct.Struct('>' + ''.join(codes))
+        self.has_str = '16s' in codes
+        registers = collections.defaultdict(list)
+        for i, arg_type in enumerate(self.arg_types):
+            if arg_type.is_reg:
+                registers[arg_type].append(i)
+        self.registers = list(registers.items())
+
+    @classmethod
+    def struct_code(cls, arg_format):
+        try:
+            return cls.codes[arg_format]
+        except KeyError:
+            arg_type = ArgFormats[arg_format]
+            for base, code in cls.struct_codes:
+                if issubclass(arg_type, base):
+                    break
+            else:
+                code = None
+            cls.codes[arg_format] = code
+            return code
+
+class BytecodeDecoder:
+    """ Decode bytecode in a buffer such as a memory-mapped file.
+    The layout of the arguments is determined once per opcode (and
+    number of arguments if variable), and the arguments are then
+    decoded by one call to a precompiled :py:class:`struct.Struct`.
+    Iterating yields :py:class:`ParsedInstruction` objects.
+
+    :param buffer: bytes-like object
+    """
+    header = struct.Struct('>Q')
+    length = struct.Struct('>I')
+    code_mask = (1 << Instruction.code_length) - 1
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        # opcode to instruction class and layout if fixed
+        self.types = {}
+        # opcode and number of arguments to layout
+        self.layouts = {}
+
+    def get_type(self, code):
+        try:
+            t = ParsedInstruction.get_reverse_opcodes()[code]
+        except KeyError:
+            raise CompilerError('unknown opcode: 0x%x' % code)
+        try:
+            len(t.arg_format)
+            layout = ArgLayout(list(t.arg_format))
+        except (TypeError, AttributeError):
+            layout = None
+        self.types[code] = t, layout
+        return t, layout
+
+    def get_layout(self, code, t, n_args):
+        key = code, n_args
+        try:
+            return self.layouts[key]
+        except KeyError:
+            pass
+        if t.__name__ == 'cisc':
+            arg_format = itertools.chain(['str'], itertools.repeat('int'))
+        else:
+            try:
+                arg_format = iter(t.arg_format)
+            except TypeError:
+                # the format depends on the preceding arguments
+                return None
+        layout = ArgLayout(list(itertools.islice(arg_format, n_args)))
+        self.layouts[key] = layout
+        return layout
+
+    def read_arg(self, arg_format, offset):
+        buffer = self.buffer
+        code = ArgLayout.struct_code(arg_format)
+        if code is None:
+            n = self.length.unpack_from(buffer, offset)[0]
+            offset += 4
+            return str(buffer[offset:offset + n], 'ascii'), offset + n
+        elif code == '16s':
+            value = buffer[offset:offset + 16]
+            return str(value[0:value.find(b'\0')], 'ascii'), offset + 16
+        else:
+            code = '>' + code
+            return struct.unpack_from(code, buffer, offset)[0], \
+                offset + struct.calcsize(code)
+
+    def read_args(self, layout, offset):
+        """ Decode arguments according to layout. """
+        if layout.fixed:
+            values = layout.fixed.unpack_from(self.buffer, offset)
+            if layout.has_str:
+                values = [str(x[0:x.find(b'\0')], 'ascii')
+                          if isinstance(x, bytes) else x for x in values]
+            return values, offset + layout.fixed.size
+        values = []
+        for f in layout.formats:
+            value, offset = self.read_arg(f, offset)
+            values.append(value)
+        return values, offset
+
+    def read_dynamic_args(self, t, n_args, offset):
+        formats = []
+        values = []
+        def arg_iter():
+            i = 0
+            while True:
+                value = values[i]
+                yield value if isinstance(value, int) else None
+                i += 1
+        arg_format = t.dynamic_arg_format(arg_iter())
+        for i in range(n_args):
+            formats.append(next(arg_format))
+            value, offset = self.read_arg(formats[-1], offset)
+            values.append(value)
+        return ArgLayout(formats), values, offset
+
+    def decode(self, offset):
+        """ Decode instruction without creating objects per argument.
+
+        :param offset: position in buffer
+        :returns: tuple of opcode, vector size, instruction class,
+          whether the number of arguments is variable,
+          :py:class:`ArgLayout`, argument values, and the position of
+          the next instruction
+        """
+        buffer = self.buffer
+        full_code = self.header.unpack_from(buffer, offset)[0]
+        offset += 8
+        code = full_code & self.code_mask
+        size = full_code >> Instruction.code_length
+        try:
+            t, layout = self.types[code]
+        except KeyError:
+            t, layout = self.get_type(code)
+        if layout:
+            values, offset = self.read_args(layout, offset)
+            return code, size, t, False, layout, values, offset
+        n_args = self.length.unpack_from(buffer, offset)[0]
+        offset += 4
+        layout = self.layouts.get((code, n_args)) or \
+            self.get_layout(code, t, n_args)
+        if layout:
+            values, offset = self.read_args(layout, offset)
+        else:
+            layout, values, offset = self.read_dynamic_args(t, n_args,
+                                                            offset)
+        return code, size, t, True, layout, values, offset
+
+    def __iter__(self):
+        offset = 0
+        end = len(self.buffer)
+        from_values = ParsedInstruction.from_values
+        while offset < end:
+            res = self.decode(offset)
+            offset = res[-1]
+            yield from_values(*res[:-1])
+
+    def summary(self):
+        """ Tally instructions as well as register and memory usage
+        without creating objects.
+
+        :returns: tuple of dictionaries from instruction classes to
+          the number of occurrences, from register argument formats to
+          the number of registers used (maximum index plus vector size),
+          and from register argument formats to the number of memory
+          cells used by direct memory instructions
+        """
+        counts = collections.defaultdict(lambda: 0)
+        registers = collections.defaultdict(lambda: 0)
+        memory = collections.defaultdict(lambda: 0)
+        buffer = self.buffer
+        unpack_header = self.header.unpack_from
+        code_mask = self.code_mask
+        code_length = Instruction.code_length
+        # opcode to decoding function, length, class, register
+        # positions, and memory type for fixed layouts
+        fast = {}
+        offset = 0
+        end = len(buffer)
+        while offset < end:
+            full_code = unpack_header(buffer, offset)[0]
+            size = full_code >> code_length
+            info = fast.get(full_code & code_mask)
+            if info:
+                unpack, length, t, regs, mem_type = info
+                values = unpack(buffer, offset + 8)
+                offset += length
+            else:
+                code, size, t, var_args, layout, values, next_offset = \
+                    self.decode(offset)
+                regs = layout.registers
+                mem_type = None
+                if issubclass(t, DirectMemoryInstruction):
+                    mem_type = layout.arg_types[0]
+                if not var_args and layout.fixed and not layout.has_str:
+                    fast[code] = layout.fixed.unpack_from, \
+                        next_offset - offset, t, regs, mem_type
+                offset = next_offset
+            counts[t] += 1
+            for arg_type, indices in regs:
+                n = max(map(values.__getitem__, indices)) + size
+                if n > registers[arg_type]:
+                    registers[arg_type] = n
+            if mem_type:
+                memory[mem_type] = max(memory[mem_type], values[1] + size)
+        return counts, registers, memory
+
 class VarArgsInstruction(Instruction):
     def has_var_args(self):
         return True
@@ -371,7 +371,7 @@ class Function:
                         runtime_args[i_arg] = t.load_mem(bases[t] + i)
                         i += util.mem_size(t)
                 return self.function(*(list(compile_args) + runtime_args))
-            self.on_first_call(wrapped_function)
+            self.on_first_call(wrapped_function, args, type_args)
             self.type_args[key] = type_args
         type_args = self.type_args[key]
         base = instructions.program.malloc(len(type_args), 'ci')
@@ -395,10 +395,13 @@ class FunctionTape(Function):
                  single_thread=False):
         Function.__init__(self, function, name, compile_args)
         self.single_thread = single_thread
-    def on_first_call(self, wrapped_function):
+    def on_first_call(self, wrapped_function, args, type_args):
+        cache = get_program().function_cache
+        cache_key = cache and cache.key(self, args, type_args, get_program())
         self.thread = MPCThread(wrapped_function, self.name,
                                 args=self.compile_args,
-                                single_thread=self.single_thread)
+                                single_thread=self.single_thread,
+                                cache_key=cache_key)
     def on_call(self, base, bases):
         return FunctionTapeCall(self.thread, base, bases)
 
@@ -426,7 +429,7 @@ def unmemorize(x):
         return x.read()
 
 class FunctionBlock(Function):
-    def on_first_call(self, wrapped_function):
+    def on_first_call(self, wrapped_function, args, type_args):
         p_return_address = get_tape().program.malloc(1, 'ci')
         old_block = get_tape().active_basicblock
         parent_node = old_block.req_node
@@ -789,7 +792,8 @@ def for_range_opt(start, stop=None, step=None, budget=None):
 
 def map_reduce_single(n_parallel, n_loops, initializer=lambda *x: [],
                       reducer=lambda *x: [], mem_state=None, budget=None):
-    budget = budget or get_program().budget
+    tuner = None if budget else get_program().auto_budget
+    budget = budget or (tuner.max_budget if tuner else get_program().budget)
     if not (isinstance(n_parallel, int) or n_parallel is None):
         raise CompilerError('Number of parallel executions must be constant')
     n_parallel = 1 if is_zero(n_parallel) else n_parallel
@@ -849,12 +853,24 @@ def map_reduce_single(n_parallel, n_loops, initializer=lambda *x: [],
                 block = get_block()
                 assert not isinstance(n_loops, int) or n_loops > 0
                 pre = copy.copy(loop_body.__globals__)
+                unroll = None
+                if tuner:
+                    key = tuner.key(loop_body, n_loops, budget)
+                    unroll = tuner.get(key)
+                    probes = []
                 while (not util.is_constant(n_loops) or k < n_loops) \
                       and (len(get_block()) < budget or k == 0) \
+                      and (unroll is None or k < unroll) \
                       and block is get_block():
                     j = i + k
                     state = reducer(tuplify(loop_body(j)), state)
                     k += 1
+                    if tuner and unroll is None and block is get_block():
+                        probes.append(tuner.measure(block, get_program()))
+                        if len(probes) == tuner.n_probes:
+                            unroll = tuner.choose(
+                                key, probes, n_loops if util.is_constant(
+                                    n_loops) else None, budget)
                 RegintOptimizer().run(block.instructions, get_program())
                 _link(pre, loop_body.__globals__)
                 r = reducer(mem_state, state)
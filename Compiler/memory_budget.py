@@ -0,0 +1,91 @@
+"""
+This module implements the memory limit set by ``compile.py
+--max-compiler-memory``. The resident memory is checked for every
+basic block while optimizing a tape, and the compiler switches to
+strategies using less memory when approaching the limit: the compact
+dependency graph, not merging a block at all, and moving the byte
+encoding of finished blocks to a temporary file until the tape is
+written.
+"""
+
+import copy
+import tempfile
+
+from .profiling import current_rss
+
+class MemoryBudget:
+    """ Compile-time memory limit.
+
+    :param limit: maximum resident memory in MB
+    """
+
+    # estimated memory per instruction of the dependency graph in bytes
+    graph_cost = 1500
+    compact_graph_cost = 900
+    # share of the limit from which encoded blocks are moved to disk
+    spill_threshold = 0.75
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.spill_file = None
+        self.n_spilled = 0
+        self.warned = False
+
+    def available(self):
+        """ Remaining memory in MB. """
+        rss = current_rss()
+        if rss is None:
+            return float('inf')
+        return self.limit - rss
+
+    def merge_options(self, n_instructions, options):
+        """ Options for merging a basic block within the limit.
+
+        :param n_instructions: number of instructions in block
+        :param options: compilation options
+        :returns: :py:obj:`options`, a copy using the compact graph, or
+          :py:obj:`None` if the block shouldn't be merged
+        """
+        available = self.available() * 2 ** 20
+        if options.compact_graph:
+            if n_instructions * self.compact_graph_cost < available:
+                return options
+        elif n_instructions * self.graph_cost < available:
+            return options
+        elif n_instructions * self.compact_graph_cost < available:
+            options = copy.copy(options)
+            options.compact_graph = True
+            return options
+        return None
+
+    def spill(self, block):
+        """ Move the byte encoding of a block to the temporary file if
+        beyond the threshold. """
+        if block.spilled is not None or not block.encoded or \
+           self.available() > (1 - self.spill_threshold) * self.limit:
+            return
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='mp-spdz-')
+        data = block.encoded
+        self.spill_file.seek(0, 2)
+        offset = self.spill_file.tell()
+        self.spill_file.write(data)
+        block.encoded = None
+        block.spilled = offset, len(data)
+        self.n_spilled += 1
+
+    def read(self, spilled):
+        """ Read encoding from temporary file.
+
+        :param spilled: offset and length
+        """
+        offset, length = spilled
+        self.spill_file.seek(offset)
+        return self.spill_file.read(length)
+
+    def check(self):
+        """ Warn once if the limit is exceeded. """
+        if not self.warned and self.available() < 0:
+            print('WARNING: Compilation exceeds memory limit of %d MB' %
+                  self.limit)
+            self.warned = True
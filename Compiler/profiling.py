@@ -0,0 +1,128 @@
+"""
+This module implements the phase profiler activated by ``compile.py
+--profile-compiler``. It records wall time, CPU time, and the peak
+resident memory for every phase of the compilation, per tape and per
+basic block where applicable. Nested phases such as the compilation
+of a thread tape while executing the source are accounted for
+separately so that the time spent in each phase itself is available.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss():
+    """ Peak resident memory of the process in MB or :py:obj:`None`
+    if unknown. """
+    if resource is None:
+        return None
+    res = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return res / 2 ** 20
+    else:
+        return res / 2 ** 10
+
+def current_rss():
+    """ Current resident memory of the process in MB, the peak if
+    unavailable, or :py:obj:`None` if unknown. """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+class Profiler:
+    """ Collects the records of all phases. """
+
+    def __init__(self):
+        self.records = []
+        self.stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name, tape=None, block=None):
+        """ Context manager recording a phase.
+
+        :param name: phase name
+        :param tape: tape or :py:obj:`None`
+        :param block: basic block or :py:obj:`None`
+        """
+        record = dict(phase=name, tape=None if tape is None else str(tape),
+                      block=None, depth=len(self.stack))
+        if block is not None:
+            record['block'] = block.name
+            record['instructions'] = len(block)
+        # wall time, CPU time, and peak increase of nested phases
+        children = [0, 0, 0]
+        self.stack.append(children)
+        rss = peak_rss()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            self.stack.pop()
+            record.update(wall=wall, cpu=cpu, self_wall=wall - children[0],
+                          self_cpu=cpu - children[1])
+            increase = 0
+            if rss is not None:
+                record['peak_rss'] = peak_rss()
+                increase = record['peak_rss'] - rss
+                record['peak_rss_increase'] = increase
+                record['self_peak_rss_increase'] = increase - children[2]
+            if self.stack:
+                self.stack[-1][0] += wall
+                self.stack[-1][1] += cpu
+                self.stack[-1][2] += increase
+            self.records.append(record)
+
+    def by_phase(self):
+        """ Totals of the time spent in each phase itself. """
+        res = {}
+        for record in self.records:
+            total = res.setdefault(record['phase'], dict(
+                count=0, wall=0, cpu=0, peak_rss_increase=0))
+            total['count'] += 1
+            total['wall'] += record['self_wall']
+            total['cpu'] += record['self_cpu']
+            total['peak_rss_increase'] += record.get(
+                'self_peak_rss_increase', 0)
+        return res
+
+    def write(self, filename, program_name):
+        """ Write JSON report to file. """
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as out:
+            json.dump(dict(program=program_name, peak_rss=peak_rss(),
+                           phases=self.by_phase(), records=self.records),
+                      out, indent=1)
+
+    def print_summary(self, n_top=10):
+        """ Print the phases and the tapes/blocks with the highest
+        cost. """
+        print('Compilation phase       wall (s)   CPU (s)  peak increase (MB)')
+        for name, total in sorted(self.by_phase().items(),
+                                  key=lambda x: -x[1]['wall']):
+            print('%-20s %11.3f %9.3f %19.1f' % (
+                name, total['wall'], total['cpu'],
+                total['peak_rss_increase']))
+        print('Most expensive phases of tapes and blocks:')
+        for record in sorted(self.records, key=lambda x: -x['self_wall'])[
+                :n_top]:
+            where = record['block'] or record['tape'] or 'main'
+            if 'instructions' in record:
+                where += ' (%d instructions)' % record['instructions']
+            print('%9.3f s %-20s %s' % (record['self_wall'],
+                                        record['phase'], where))
+        rss = peak_rss()
+        if rss is not None:
+            print('Peak memory usage: %.1f MB' % rss)
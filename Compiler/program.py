@@ -4,9 +4,12 @@ blocks and registers. Most relevant is the central :py:class:`Program`
 object that holds various properties of the computation.
 """
 
+import contextlib
 import inspect
 import itertools
+import json
 import math
+import mmap
 import os
 import re
 import sys
@@ -64,11 +67,20 @@ class defaults:
     preserve_mem_order = False
     max_parallel_open = 0
     dead_code_elimination = False
+    cse = False
+    join_blocks = False
     noreallocate = False
+    interval_allocation = False
     asmoutfile = None
     stop = False
     insecure = False
     keep_cisc = False
+    jobs = 1
+    compact_graph = False
+    profile_compiler = False
+    max_compiler_memory = None
+    requirements_only = False
+    cost_report = None
 
 
 class Program(object):
@@ -123,6 +135,19 @@ class Program(object):
         self.tape_counter = 0
         self._curr_tape = None
         self.DEBUG = options.debug
+        if options.profile_compiler:
+            from .profiling import Profiler
+
+            self.profiler = Profiler()
+        else:
+            self.profiler = None
+        if options.max_compiler_memory:
+            from .memory_budget import MemoryBudget
+
+            self.memory_budget = MemoryBudget(
+                float(options.max_compiler_memory))
+        else:
+            self.memory_budget = None
         self.allocated_mem = RegType.create_dict(lambda: USER_MEM)
         self.free_mem_blocks = defaultdict(al.BlockAllocator)
         self.later_mem_blocks = defaultdict(list)
@@ -133,7 +158,15 @@ class Program(object):
         self.n_threads = 1
         self.public_input_file = None
         self.types = {}
-        if self.options.budget:
+        self.auto_budget = None
+        self.function_cache = None
+        if str(self.options.budget).startswith("auto"):
+            from .autobudget import AutoBudget
+
+            self.auto_budget = AutoBudget.from_option(
+                self.options.budget,
+                self.programs_dir + "/Budgets/%s.json" % self.name)
+        if self.options.budget and not self.auto_budget:
             self.budget = int(self.options.budget)
         else:
             if self.options.optimize_hard:
@@ -278,7 +311,8 @@ class Program(object):
         self.non_linear = Ring(ring_size)
         self.options.ring = str(ring_size)
 
-    def new_tape(self, function, args=[], name=None, single_thread=False):
+    def new_tape(self, function, args=[], name=None, single_thread=False,
+                 cache_key=None):
         """
         Create a new tape from a function. See
         :py:func:`~Compiler.library.multithread` and
@@ -299,6 +333,7 @@ class Program(object):
         :param name: name used for files
         :param single_thread: Boolean indicating whether tape will
             never be run in parallel to itself
+        :param cache_key: key for reusing the tape with ``--cache``
         :returns: tape handle
 
         """
@@ -312,8 +347,17 @@ class Program(object):
         self.curr_tape = Tape(name, self)
         self.curr_tape.singular = single_thread
         self.tapes.append(self.curr_tape)
-        function(*args)
-        self.finalize_tape(self.curr_tape)
+        tape = self.curr_tape
+        if not (cache_key and self.function_cache.restore(tape, cache_key)):
+            if cache_key:
+                before = self.function_cache.snapshot(self)
+                tape_counter = self.tape_counter
+            with self.profile("source", tape):
+                function(*args)
+            self.finalize_tape(tape)
+            if cache_key:
+                self.function_cache.store(tape, cache_key, before,
+                                          tape_counter)
         if self.tape_stack:
             self.curr_tape = self.tape_stack.pop()
         return tape_index
@@ -389,8 +433,7 @@ class Program(object):
         nonempty_tapes = [t for t in self.tapes]
 
         sch_filename = self.programs_dir + "/Schedules/%s.sch" % self.name
-        sch_file = open(sch_filename, "w")
-        print("Writing to", sch_filename)
+        sch_file = open(sch_filename + ".tmp", "w")
         sch_file.write(str(self.max_par_tapes()) + "\n")
         sch_file.write(str(len(nonempty_tapes)) + "\n")
         sch_file.write(" ".join("%s:%d" % (tape.name, len(tape))
@@ -406,21 +449,149 @@ class Program(object):
         else:
             sch_file.write("lgp:%s" % req)
         sch_file.write("\n")
-        sch_file.write("opts: %s\n" % " ".join(self.relevant_opts))
+        sch_file.write("opts: %s\n" %
+                       " ".join(sorted(self.relevant_opts)))
         sch_file.write("sec:%d\n" % self.used_security)
         sch_file.close()
+        with open(sch_filename + ".tmp", "rb") as sch_file:
+            digest = hashlib.sha256(sch_file.read()).digest()
+        if self.replace_if_changed(sch_filename, digest):
+            print("Writing to", sch_filename)
+        else:
+            print("Unchanged", sch_filename)
         h = hashlib.sha256()
         for tape in self.tapes:
-            tape.write_bytes()
+            with self.profile("write", tape):
+                tape.write_bytes(release=not self.options.asmoutfile)
             h.update(tape.hash)
-        print('Hash:', h.hexdigest())
+        self.hash = h.hexdigest()
+        changed = [tape.name for tape in self.tapes if tape.changed]
+        if len(changed) < len(self.tapes):
+            print("Changed tapes:", " ".join(changed) or "none")
+        self.write_manifest()
+        print('Hash:', self.hash)
+
+    def write_manifest(self):
+        """Write hashes, sizes, register usage, requirements, and the
+        memory estimate of all tapes to
+        ``Programs/Schedules/<progname>.json`` for use by other tools
+        after compilation."""
+        def usage(x):
+            return dict(sorted((str(t.reg_type), n) for t, n in x.items()
+                               if n))
+
+        def requirements(req_num):
+            if req_num is None:
+                return None
+            rounds = req_num["all", "round"]
+            return dict(data=req_num.to_json(),
+                        rounds=None if rounds == float("inf") else rounds)
+
+        # same as Scripts/memory-usage.py
+        tapes = []
+        for tape in self.tapes:
+            _, registers, _ = Tape.read_summary(tape.outfile)
+            tapes.append(dict(
+                name=tape.name, hash=tape.hash.hex(), instructions=len(tape),
+                registers=usage(registers),
+                req_bit_length=dict(tape.req_bit_length),
+                requirements=requirements(tape.req_num)))
+        outfiles = [tape.outfile for tape in self.tapes]
+        memory, registers, thread_registers = self.read_usage(outfiles)
+        memory = usage(memory)
+        ram = self.estimate_ram(
+            memory, registers, thread_registers, self.max_par_tapes(),
+            Tape.read_domain_size(outfiles[0]) or 8)
+        filename = self.programs_dir + "/Schedules/%s.json" % self.name
+        with open(filename + ".tmp", "w") as out:
+            json.dump(dict(
+                program=self.name, hash=self.hash,
+                schedule=self.programs_dir + "/Schedules/%s.sch" % self.name,
+                n_threads=self.max_par_tapes(),
+                relevant_opts=sorted(self.relevant_opts),
+                security=self.used_security,
+                ring=int(self.options.ring or 0),
+                prime=self.prime and str(self.prime),
+                tapes=tapes, memory=memory,
+                requirements=requirements(self.req_num),
+                ram=dict(zip(("min", "max"), ram))), out, indent=1)
+        with open(filename + ".tmp", "rb") as out:
+            digest = hashlib.sha256(out.read()).digest()
+        self.replace_if_changed(filename, digest)
+
+    @staticmethod
+    def estimate_ram(memory, registers, thread_registers, n_threads,
+                     domain_size):
+        """Estimate the RAM required per party in bytes from the memory
+        and register usage.
+
+        :param memory: dictionary of memory sizes
+        :param registers: dictionary of registers used by main thread
+        :param thread_registers: dictionary of maximum registers used
+          by other threads
+        :param n_threads: number of threads including main thread
+        :param domain_size: size of computation domain in bytes
+        :returns: tuple of lower and upper estimate
+        """
+        total = sum(memory.values()) + sum(registers.values())
+        thread_total = sum(thread_registers.values())
+        return (1 * domain_size * (total + thread_total),
+                3 * domain_size * (total + (n_threads - 1) * thread_total))
+
+    @staticmethod
+    def replace_if_changed(filename, digest):
+        """Move a newly written file from ``<filename>.tmp`` into
+        place unless the existing file has the same SHA-256 hash. The
+        hash is kept in ``<filename>.sha256`` together with size and
+        modification time in order to detect outside changes. Leaving
+        unchanged files untouched avoids invalidating file caches and
+        copying them to other hosts again.
+
+        :param filename: file name
+        :param digest: SHA-256 hash of new content (bytes)
+        :returns: whether the file changed
+        """
+        sidecar = filename + ".sha256"
+        try:
+            stat = os.stat(filename)
+            with open(sidecar) as f:
+                unchanged = f.read().split() == [
+                    digest.hex(), str(stat.st_size), str(stat.st_mtime_ns)]
+        except OSError:
+            unchanged = False
+        if unchanged:
+            os.remove(filename + ".tmp")
+            return False
+        os.replace(filename + ".tmp", filename)
+        stat = os.stat(filename)
+        with open(sidecar, "w") as f:
+            f.write("%s %d %d\n" % (digest.hex(), stat.st_size,
+                                     stat.st_mtime_ns))
+        return True
+
+    def profile(self, phase, tape=None, block=None):
+        """Context manager recording time and memory usage of a
+        compilation phase if requested by ``--profile-compiler``.
+
+        :param phase: name of phase
+        :param tape: tape
+        :param block: basic block
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        else:
+            return self.profiler.phase(phase, tape, block)
 
     def finalize_tape(self, tape):
         if not tape.purged:
-            tape.optimize(self.options)
-            tape.write_bytes()
-            if self.options.asmoutfile:
-                tape.write_str(self.options.asmoutfile + "-" + tape.name)
+            if self.options.requirements_only:
+                tape.estimate_requirements(self.options)
+            else:
+                tape.optimize(self.options)
+                with self.profile("write", tape):
+                    tape.write_bytes(release=not self.options.asmoutfile)
+                if self.options.asmoutfile:
+                    tape.write_str(self.options.asmoutfile + "-" + tape.name)
             tape.purge()
 
     @property
@@ -510,6 +681,9 @@ class Program(object):
         self.later_mem_blocks.clear()
 
     def finalize(self):
+        if self.options.requirements_only:
+            return self.finalize_requirements()
+
         # optimize the tapes
         for tape in self.tapes:
             tape.optimize(self.options)
@@ -525,6 +699,9 @@ class Program(object):
 
         self.write_bytes()
 
+        if self.auto_budget:
+            self.auto_budget.write()
+
         if self.options.asmoutfile:
             for tape in self.tapes:
                 tape.write_str(self.options.asmoutfile + "-" + tape.name)
@@ -532,6 +709,37 @@ class Program(object):
         # Making sure that the public_input_file has been properly closed
         if self.public_input_file is not None:
             self.public_input_file.close()
+        self.close_input_files()
+
+    def finalize_requirements(self):
+        """Determine the offline data requirements without producing
+        bytecode and write them per tape to
+        ``Programs/Requirements/<progname>.json``."""
+        for tape in self.tapes:
+            tape.estimate_requirements(self.options)
+
+        if self.tapes:
+            self.update_req(self.curr_tape)
+        if self.req_num is not None:
+            # rounds are only known after merging
+            self.req_num = self.req_num.data_only()
+
+        filename = self.programs_dir + "/Requirements/%s.json" % self.name
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        print("Writing to", filename)
+        with open(filename, "w") as out:
+            json.dump(
+                dict(program=self.name,
+                     total=None if self.req_num is None \
+                     else self.req_num.to_json(),
+                     tapes=dict((tape.name, tape.req_num.to_json())
+                                for tape in self.tapes
+                                if tape.req_num is not None)),
+                out, indent=1)
+
+        if self.public_input_file is not None:
+            self.public_input_file.close()
+        self.close_input_files()
 
     def finalize_memory(self):
         self.curr_tape.start_new_basicblock(None, "memory-usage",
@@ -562,13 +770,25 @@ class Program(object):
         self.public_input_file.write("%s\n" % str(x))
 
     def get_binary_input_file(self, player):
+        """Binary input file of a player, which keeps tensors that
+        are the same as in an earlier compilation.
+
+        :returns: :py:class:`~Compiler.binary_input.BinaryInputWriter`
+        """
         key = player, 'bin'
         if key not in self.input_files:
+            from .binary_input import BinaryInputWriter
+
             filename = 'Player-Data/Input-Binary-P%d-0' % player
             print('Writing binary data to', filename)
-            self.input_files[key] = open(filename, 'wb')
+            self.input_files[key] = BinaryInputWriter(filename)
         return self.input_files[key]
 
+    def close_input_files(self):
+        for f in self.input_files.values():
+            f.close()
+        self.input_files = {}
+
     def set_bit_length(self, bit_length):
         """Change the integer bit length for non-linear functions."""
         self.bit_length = bit_length
@@ -772,12 +992,29 @@ class Program(object):
 
     @classmethod
     def read_domain_size(cls, schedule):
-        from Compiler.instructions import reqbl_class
         tapename = cls.read_schedule(schedule)[2].strip().split(":")[0]
-        for inst in Tape.read_instructions(tapename):
-            if inst.code == reqbl_class.code:
-                bl = inst.args[0]
-                return (abs(bl.i) + 63) // 64 * 8
+        return Tape.read_domain_size(tapename)
+
+    @staticmethod
+    def read_usage(tapenames):
+        """Memory usage of all tapes and register usage of the main
+        thread and the other threads as read from the bytecode, which
+        is what the virtual machine uses.
+
+        :param tapenames: tape names or bytecode files, main thread first
+        :returns: three dictionaries by argument format
+        """
+        memory = defaultdict(lambda: 0)
+        registers = defaultdict(lambda: 0)
+        thread_registers = defaultdict(lambda: 0)
+        for i, tapename in enumerate(tapenames):
+            _, tape_registers, tape_memory = Tape.read_summary(tapename)
+            for total, usage in ((memory, tape_memory),
+                                 (thread_registers if i else registers,
+                                  tape_registers)):
+                for t, n in usage.items():
+                    total[t] = max(total[t], n)
+        return memory, registers, thread_registers
 
 
 class Tape:
@@ -792,6 +1029,8 @@ class Tape:
         self.req_tree = self.ReqNode(name)
         self.basicblocks = []
         self.purged = False
+        self.changed = True
+        self.reg_usage = {}
         self.block_counter = 0
         self.active_basicblock = None
         self.old_allocated_mem = program.allocated_mem.copy()
@@ -806,6 +1045,7 @@ class Tape:
         self.free_threads = set()
         self.loop_breaks = []
         self.warned_about_mem = False
+        self.req_num = None
 
     class BasicBlock(object):
         def __init__(self, parent, name, scope, exit_condition=None,
@@ -825,6 +1065,8 @@ class Tape:
             else:
                 self.alloc_pool = al.AllocPool()
             self.purged = False
+            self._encoded = None
+            self.spilled = None
             self.n_rounds = 0
             self.n_to_merge = 0
             self.rounds = Tape.ReqNum()
@@ -833,7 +1075,10 @@ class Tape:
             self.used_from_scope = set()
 
         def __len__(self):
-            return len(self.instructions)
+            if self.purged:
+                return self.size
+            else:
+                return len(self.instructions)
 
         def new_reg(self, reg_type, size=None):
             return self.parent.new_reg(reg_type, size=size)
@@ -869,7 +1114,35 @@ class Tape:
             offset = self.get_offset(self.exit_block)
             self.exit_condition.set_relative_jump(offset)
 
+        def get_bytes(self):
+            if self.purged:
+                return self.encoded
+            else:
+                return b"".join(
+                    i.get_bytes() for i in self.instructions if i is not None
+                )
+
+        @property
+        def encoded(self):
+            if self.spilled is not None:
+                return self.parent.program.memory_budget.read(self.spilled)
+            return self._encoded
+
+        @encoded.setter
+        def encoded(self, value):
+            self._encoded = value
+            self.spilled = None
+
+        def encode(self):
+            """Replace the instructions by their byte encoding (must be
+            done after register allocation)"""
+            self.encoded = self.get_bytes()
+            self.purge()
+
         def purge(self, retain_usage=True):
+            if self.purged:
+                return
+
             def relevant(inst):
                 req_node = Tape.ReqNode("")
                 req_node.num = Tape.ReqNum()
@@ -882,6 +1155,7 @@ class Tape:
                 self.usage_instructions = []
             if len(self.usage_instructions) > 1000:
                 print("Retaining %d instructions" % len(self.usage_instructions))
+            self.size = len(self.instructions)
             del self.instructions
             self.purged = True
 
@@ -968,6 +1242,8 @@ class Tape:
             return sum(len(block) for block in self.basicblocks)
 
     def purge(self):
+        if self.purged:
+            return
         self.size = len(self)
         for block in self.basicblocks:
             block.purge()
@@ -1005,13 +1281,43 @@ class Tape:
                 "Processing tape", self.name, "with %d blocks" % len(self.basicblocks)
             )
 
+        if options.join_blocks:
+            with self.program.profile("join blocks", self):
+                n_joined = al.BlockJoiner(self).run()
+            if n_joined and self.program.verbose:
+                print("Joined %d basic blocks" % n_joined)
+
+        if options.cse:
+            with self.program.profile("cse", self):
+                n_removed = al.CommonSubexpressionEliminator(self).run()
+            if n_removed and self.program.verbose:
+                print("Common subexpression elimination removed %d "
+                      "instructions" % n_removed)
+
         for block in self.basicblocks:
-            al.determine_scope(block, options)
+            with self.program.profile("determine scope", self, block):
+                al.determine_scope(block, options)
 
         # merge open instructions
         # need to do this if there are several blocks
+        budget = self.program.memory_budget
         if (options.merge_opens and self.merge_opens) or options.dead_code_elimination:
+            plans = self.plan_merges(options)
             for i, block in enumerate(self.basicblocks):
+                merge_options = options
+                if budget and block not in plans:
+                    merge_options = budget.merge_options(
+                        len(block.instructions), options)
+                    if merge_options is None:
+                        print("Not merging basic block %s with %d "
+                              "instructions to stay within memory limit"
+                              % (block.name, len(block.instructions)))
+                        self.count_unmerged_rounds(block, options)
+                        continue
+                    elif merge_options is not options and \
+                         self.program.verbose:
+                        print("Using compact dependency graph for basic "
+                              "block %s" % block.name)
                 if len(block.instructions) > 0 and self.program.verbose:
                     print(
                         "Processing basic block %s, %d/%d, %d instructions"
@@ -1022,19 +1328,26 @@ class Tape:
                             len(block.instructions),
                         )
                     )
-                # the next call is necessary for allocation later even without merging
-                merger = al.Merger(block, options, tuple(self.program.to_merge))
+                # dependency graph for merging and dead code elimination
+                with self.program.profile("dependency graph", self, block):
+                    if block in plans:
+                        merger = al.MergePlan(block, plans.pop(block))
+                    else:
+                        merger = al.Merger(block, merge_options,
+                                           tuple(self.program.to_merge))
                 if options.dead_code_elimination:
                     if len(block.instructions) > 1000000:
                         print("Eliminate dead code...")
-                    merger.eliminate_dead_code()
+                    with self.program.profile("dead code", self, block):
+                        merger.eliminate_dead_code()
                 if options.merge_opens and self.merge_opens:
                     if len(block.instructions) == 0:
                         block.used_from_scope = util.set_by_id()
                         continue
                     if len(block.instructions) > 1000000:
                         print("Merging instructions...")
-                    numrounds = merger.longest_paths_merge()
+                    with self.program.profile("merge", self, block):
+                        numrounds = merger.longest_paths_merge()
                     block.n_rounds = numrounds
                     block.n_to_merge = len(merger.open_nodes)
                     if options.verbose:
@@ -1061,6 +1374,8 @@ class Tape:
                     block.instructions = [
                         x for x in block.instructions if x is not None
                     ]
+                if budget:
+                    budget.check()
         if not (options.merge_opens and self.merge_opens):
             print("Not merging instructions in tape %s" % self.name)
 
@@ -1086,6 +1401,7 @@ class Tape:
         # allocate registers
         reg_counts = self.count_regs()
         if options.noreallocate:
+            self.reg_usage = dict(reg_counts)
             if self.program.verbose:
                 print("Tape register usage:", dict(reg_counts))
         else:
@@ -1100,7 +1416,10 @@ class Tape:
                     % (reg_counts[RegType.ClearGF2N], reg_counts[RegType.SecretGF2N])
                 )
                 print("Re-allocating...")
-            allocator = al.StraightlineAllocator(REG_MAX, self.program)
+            if options.interval_allocation:
+                allocator = al.IntervalAllocator(REG_MAX, self.program)
+            else:
+                allocator = al.StraightlineAllocator(REG_MAX, self.program)
 
             # make addresses available in functions
             for addr in self.program.base_addresses:
@@ -1127,6 +1446,7 @@ class Tape:
                             left.append(child)
 
             allocator.old_pool = None
+            n_spilled = budget.n_spilled if budget else 0
             for i, block in enumerate(reversed(self.basicblocks)):
                 if len(block.instructions) > 1000000:
                     print(
@@ -1141,7 +1461,16 @@ class Tape:
                     ):
                         alloc_loop(block.exit_block.scope)
                 usage = allocator.max_usage.copy()
-                allocator.process(block.instructions, block.alloc_pool)
+                with self.program.profile("allocation", self, block):
+                    allocator.process(block.instructions, block.alloc_pool)
+                # free memory
+                if not options.asmoutfile:
+                    with self.program.profile("encoding", self, block):
+                        block.encode()
+                    if budget:
+                        budget.spill(block)
+                if budget:
+                    budget.check()
                 if self.program.verbose and usage != allocator.max_usage:
                     print("Allocated registers in %s " % block.name, end="")
                     for t, n in allocator.max_usage.items():
@@ -1149,8 +1478,12 @@ class Tape:
                             print("%s:%d " % (t, n - usage[t]), end="")
                     print()
             allocator.finalize(options)
+            self.reg_usage = dict(allocator.max_usage)
             if self.program.verbose:
                 print("Tape register usage:", dict(allocator.max_usage))
+                if budget and budget.n_spilled > n_spilled:
+                    print("Moved %d encoded blocks to disk" %
+                          (budget.n_spilled - n_spilled))
                 scopes = set(block.alloc_pool for block in self.basicblocks)
                 n_fragments = sum(scope.n_fragments() for scope in scopes)
                 print("%d register fragments in %d scopes" % (n_fragments, len(scopes)))
@@ -1158,48 +1491,47 @@ class Tape:
         # offline data requirements
         if self.program.verbose:
             print("Compile offline data requirements...")
-        for block in self.basicblocks:
-            block.req_node.add_block(block)
-        self.req_num = self.req_tree.aggregate()
+        self.aggregate_requirements()
         if self.program.verbose:
             print("Tape requires", self.req_num)
+        requirements = []
         for req, num in sorted(self.req_num.items()):
             if num == float("inf") or num >= 2**64:
                 num = -1
             if req[1] in data_types:
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use(
                         field_types[req[0]], data_types[req[1]], num, add_to_prog=False
                     )
                 )
             elif req[1] == "input":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use_inp(
                         field_types[req[0]], req[2], num, add_to_prog=False
                     )
                 )
             elif req[0] == "modp":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use_prep(req[1], num, add_to_prog=False)
                 )
             elif req[0] == "gf2n":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.guse_prep(req[1], num, add_to_prog=False)
                 )
             elif req[0] == "edabit":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use_edabit(
                         False, req[1], num, add_to_prog=False
                     )
                 )
             elif req[0] == "sedabit":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use_edabit(
                         True, req[1], num, add_to_prog=False
                     )
                 )
             elif req[0] == "matmul":
-                self.basicblocks[-1].instructions.append(
+                requirements.append(
                     Compiler.instructions.use_matmul(*req[1], num, add_to_prog=False)
                 )
 
@@ -1210,20 +1542,107 @@ class Tape:
                     bl = self.req_bit_length[x]
                     if self.program.options.ring:
                         bl = -int(self.program.options.ring)
-                    self.basicblocks[-1].instructions.append(
+                    requirements.append(
                         Compiler.instructions.reqbl(bl, add_to_prog=False)
                     )
             if self.program.verbose:
                 print("Tape requires prime bit length", self.req_bit_length["p"])
                 print("Tape requires galois bit length", self.req_bit_length["2"])
 
+        if requirements:
+            last = self.basicblocks[-1]
+            if last.purged:
+                last.encoded += b"".join(i.get_bytes() for i in requirements)
+                last.size += len(requirements)
+            else:
+                last.instructions += requirements
+
+    def aggregate_requirements(self):
+        with self.program.profile("requirements", self):
+            for block in self.basicblocks:
+                block.req_node.add_block(block)
+            self.req_num = self.req_tree.aggregate()
+
+    @unpurged
+    def estimate_requirements(self, options):
+        """Determine the offline data requirements without merging,
+        register allocation, and encoding. This still runs dead code
+        elimination and CISC expansion because they change the
+        requirements, so the result is the same as after
+        :py:func:`optimize` except for the number of rounds."""
+        if len(self.basicblocks) == 0:
+            return
+
+        if options.dead_code_elimination:
+            for block in self.basicblocks:
+                with self.program.profile("determine scope", self, block):
+                    al.determine_scope(block, options)
+            for block in self.basicblocks:
+                with self.program.profile("dead code", self, block):
+                    merger = al.Merger(block, options,
+                                       tuple(self.program.to_merge))
+                    merger.eliminate_dead_code()
+                    merger = None
+                    block.instructions = [
+                        x for x in block.instructions if x is not None
+                    ]
+
+        if options.cisc:
+            self.expand_cisc()
+
+        self.aggregate_requirements()
+        if self.program.verbose:
+            print("Tape requires", self.req_num.data_only())
+
+    def plan_merges(self, options):
+        """Merge larger basic blocks in worker processes if requested.
+        The blocks are independent at this stage, and the results are
+        applied in order, so the output is the same as when merging
+        sequentially.
+
+        With a memory limit, only blocks whose dependency graphs fit
+        into the available memory once per worker are merged in
+        parallel. The others are merged sequentially.
+
+        :returns: dictionary from blocks to plans for
+          :py:class:`~Compiler.allocator.MergePlan`
+        """
+        jobs = int(options.jobs or 1)
+        budget = self.program.memory_budget
+        blocks = [block for block in self.basicblocks
+                  if len(block.instructions) >= al.min_parallel_merge and
+                  (not budget or budget.merge_options(
+                      len(block.instructions) * jobs, options) is options)]
+        if jobs < 2 or len(blocks) < 2:
+            return {}
+        with self.program.profile("parallel merge", self):
+            plans = al.plan_merges(blocks, options,
+                                   tuple(self.program.to_merge), jobs)
+        if plans is None:
+            return {}
+        return dict(zip(blocks, plans))
+
+    def count_unmerged_rounds(self, block, options):
+        """Set the number of rounds of a block that isn't merged,
+        where every instruction to be merged takes one round."""
+        if not (options.merge_opens and self.merge_opens):
+            return
+        counter = defaultdict(lambda: 0)
+        for inst in block.instructions:
+            if isinstance(inst, tuple(self.program.to_merge)):
+                counter[type(inst).__name__, "round"] += 1
+        block.n_rounds = block.n_to_merge = sum(counter.values())
+        if options.verbose:
+            block.rounds = counter
+
     @unpurged
     def expand_cisc(self):
         mapping = {None: None}
         blocks = self.basicblocks[:]
         self.basicblocks = []
         for block in blocks:
-            expanded = block.expand_cisc()
+            with self.program.profile("cisc expansion", self, block):
+                expanded = block.expand_cisc()
             mapping[block] = expanded
         for block in self.basicblocks:
             if block not in mapping:
@@ -1250,9 +1669,7 @@ class Tape:
     @unpurged
     def get_bytes(self):
         """Get the byte encoding of the program as an actual string of bytes."""
-        return b"".join(
-            i.get_bytes() for i in self._get_instructions() if i is not None
-        )
+        return b"".join(block.get_bytes() for block in self.basicblocks)
 
     @unpurged
     def write_encoding(self, filename):
@@ -1278,24 +1695,42 @@ class Tape:
         f.close()
 
     @unpurged
-    def write_bytes(self, filename=None):
-        """Write the program's byte encoding to a file."""
+    def write_bytes(self, filename=None, release=False):
+        """Write the program's byte encoding to a file.
+
+        :param release: free basic blocks once written and purge tape
+        """
         if filename is None:
             filename = self.outfile
         if not filename.endswith(".bc"):
             filename += ".bc"
         if "Bytecode" not in filename:
             filename = self.program.programs_dir + "/Bytecode/" + filename
-        print("Writing to", filename)
-        f = open(filename, "wb")
+        f = open(filename + ".tmp", "wb")
         h = hashlib.sha256()
-        for i in self._get_instructions():
-            if i is not None:
-                b = i.get_bytes()
-                f.write(b)
-                h.update(b)
+        for block in self.basicblocks:
+            if block.purged:
+                f.write(block.encoded)
+                h.update(block.encoded)
+                if release:
+                    block.encoded = None
+            else:
+                for i in block.instructions:
+                    if i is not None:
+                        b = i.get_bytes()
+                        f.write(b)
+                        h.update(b)
+                if release:
+                    block.purge()
         f.close()
         self.hash = h.digest()
+        self.changed = self.program.replace_if_changed(filename, self.hash)
+        if self.changed:
+            print("Writing to", filename)
+        else:
+            print("Unchanged", filename)
+        if release:
+            self.purge()
 
     def new_reg(self, reg_type, size=None):
         return self.Register(reg_type, self, size=size)
@@ -1346,6 +1781,23 @@ class Tape:
                 res[i] = max(self[i], other[i])
             return res
 
+        def data_only(self):
+            """Requirements without the number of rounds."""
+            return Tape.ReqNum((req, num) for req, num in self.items()
+                               if req[0] != "all")
+
+        def to_json(self):
+            """List of requirements for JSON output."""
+            res = []
+            for req, num in sorted(self.data_only().items()):
+                if num == float("inf"):
+                    num = None
+                item = dict(domain=req[0], type=req[1], number=num)
+                if req[1] == "input":
+                    item["player"] = req[2]
+                res.append(item)
+            return res
+
         def cost(self):
             return sum(
                 num * COST[req[0]][req[1]]
@@ -1482,9 +1934,33 @@ class Tape:
 
     @staticmethod
     def read_instructions(tapename):
-        tape = open("Programs/Bytecode/%s.bc" % tapename, "rb")
-        while tape.peek():
-            yield inst_base.ParsedInstruction(tape)
+        return inst_base.BytecodeDecoder(Tape.map_bytecode(tapename))
+
+    @staticmethod
+    def read_domain_size(tapename):
+        from Compiler.instructions import reqbl_class
+        for inst in Tape.read_instructions(tapename):
+            if inst.code == reqbl_class.code:
+                bl = inst.args[0]
+                return (abs(bl.i) + 63) // 64 * 8
+
+    @staticmethod
+    def read_summary(tapename):
+        """Numbers of instructions as well as register and memory usage
+        of a tape without creating instruction objects (see
+        :py:meth:`~Compiler.instructions_base.BytecodeDecoder.summary`)."""
+        return inst_base.BytecodeDecoder(Tape.map_bytecode(tapename)).summary()
+
+    @staticmethod
+    def map_bytecode(tapename):
+        if not tapename.endswith(".bc"):
+            tapename = "Programs/Bytecode/%s.bc" % tapename
+        with open(tapename, "rb") as tape:
+            try:
+                return mmap.mmap(tape.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                return b""
 
     class _no_truth(object):
         __slots__ = []
@@ -1514,7 +1990,7 @@ class Tape:
             "vectorbase",
             "caller",
             "can_eliminate",
-            "duplicates",
+            "_duplicates",
             "block",
         ]
         maximum_size = 2 ** (64 - inst_base.Instruction.code_length) - 1
@@ -1544,9 +2020,10 @@ class Tape:
                 program.reg_counter[reg_type] += size
             else:
                 self.i = float("inf")
-            self.vector = []
+            self.vector = ()
             self.can_eliminate = True
-            self.duplicates = util.set_by_id([self])
+            # only linked registers have a set of duplicates
+            self._duplicates = None
             if Program.prog.DEBUG:
                 self.caller = [frame[1:] for frame in inspect.stack()[1:]]
             else:
@@ -1606,6 +2083,24 @@ class Tape:
         def get_all(self):
             return self.vector or [self]
 
+        @property
+        def duplicates(self):
+            """Registers sharing the address with this one (see
+            :py:meth:`link`) including itself unless already defined
+            during allocation."""
+            if self._duplicates is None:
+                return (self,)
+            else:
+                return self._duplicates
+
+        def remove_from_duplicates(self):
+            """Remove register from the registers sharing its address,
+            which happens when the allocator reaches the definition."""
+            if self._duplicates is None:
+                self._duplicates = ()
+            elif self._duplicates:
+                self._duplicates.remove(self)
+
         def __getitem__(self, index):
             if self.size == 1 and index == 0:
                 return self
@@ -1624,9 +2119,11 @@ class Tape:
                 raise CompilerError("reallocation necessary for linking, "
                                     "remove option -u")
             assert self.reg_type == other.reg_type
-            self.duplicates |= other.duplicates
-            for dup in self.duplicates:
-                dup.duplicates = self.duplicates
+            if self._duplicates is None:
+                self._duplicates = util.set_by_id([self])
+            self._duplicates |= other.duplicates
+            for dup in self._duplicates:
+                dup._duplicates = self._duplicates
 
         def update(self, other):
             """
@@ -84,7 +84,7 @@ class ClientMessageType:
 
 class MPCThread(object):
     def __init__(self, target, name, args = [], runtime_arg = 0,
-                 single_thread = False):
+                 single_thread = False, cache_key = None):
         """ Create a thread from a callable object. """
         if not callable(target):
             raise CompilerError('Target %s for thread %s is not callable' % (target,name))
@@ -95,7 +95,8 @@ class MPCThread(object):
         self.runtime_arg = runtime_arg
         self.running = 0
         self.tape_handle = program.new_tape(target, args, name,
-                                            single_thread=single_thread)
+                                            single_thread=single_thread,
+                                            cache_key=cache_key)
         self.run_handles = []
     
     def start(self, runtime_arg = None):
@@ -561,6 +562,44 @@ class _structure(Tape._no_truth):
         return 1
 
 class _secret_structure(_structure):
+    @staticmethod
+    def _text_input_shape(content):
+        shape = []
+        tmp = content
+        while True:
+            try:
+                shape.append(len(tmp))
+                tmp = tmp[0]
+            except:
+                break
+        return shape
+
+    @staticmethod
+    def _write_text_input(f, content, shape):
+        """ Write elements of nested lists or an array in text input
+        format, each preceded by a space. """
+        if hasattr(content, 'ravel') and content.dtype.kind != 'O':
+            # numpy array
+            content = content.ravel()
+            if content.dtype.kind in 'iu' or content.dtype == float:
+                # same string representation as Python numbers
+                content = content.tolist()
+            step = 2 ** 16
+            for i in range(0, len(content), step):
+                f.write(' ')
+                f.write(' '.join(map(str, content[i:i + step])))
+            return
+        def traverse(content, level):
+            assert len(content) == shape[level]
+            if level == len(shape) - 1:
+                if len(content):
+                    f.write(' ')
+                    f.write(' '.join(map(str, content)))
+            else:
+                for x in content:
+                    traverse(x, level + 1)
+        traverse(content, 0)
+
     @classmethod
     def input_tensor_from(cls, player, shape):
         """ Input tensor secretly from player.
@@ -601,9 +640,23 @@ class _secret_structure(_structure):
         ``Player-Data/Input-Binary-P<player>-0`` if running
         on another host.
 
+        In binary mode, the format of every tensor is recorded in
+        ``Player-Data/Input-Binary-P<player>-0.json``, and tensors
+        that are the same as in the last compilation are not written
+        again (see :py:mod:`Compiler.binary_input`).
+
+        In text mode, the content can also be an iterator of chunks
+        along the first dimension such as batches of rows, which
+        avoids holding all data in memory::
+
+          def rows():
+              for i in range(10 ** 6):
+                  yield [[i, i + 1]]
+          sint.input_tensor_via(0, rows(), binary=False)
+
         :param player: player to input via (int)
-        :param content: nested Python list or numpy array (binary mode only) or
-          left out if not available
+        :param content: nested Python list or numpy array, iterator
+          of those (text mode only), or left out if not available
         :param shape: shape if content not given
         :param binary: binary mode (bool)
         :param one_hot: one-hot encoding (bool)
@@ -638,32 +691,35 @@ class _secret_structure(_structure):
                     content = numpy.eye(content.max() + 1)[content]
                 content = content.astype(t)
                 f = program.get_binary_input_file(player)
-                f.write(content.tobytes())
+                metadata = dict(one_hot=bool(one_hot))
+                if issubclass(cls, _fix):
+                    metadata.update(f=cls.f, k=cls.k)
+                f.append(numpy.ascontiguousarray(content), **metadata)
                 f.flush()
                 shape = content.shape
             else:
-                shape = []
-                tmp = content
-                while True:
-                    try:
-                        shape.append(len(tmp))
-                        tmp = tmp[0]
-                    except:
-                        break
                 if not program.input_files.get(player, None):
                     program.input_files[player] = open(
                         'Player-Data/Input-P%d-0' % player, 'w')
                 f = program.input_files[player]
-                def traverse(content, level):
-                    assert len(content) == shape[level]
-                    if level == len(shape) - 1:
-                        for x in content:
-                            f.write(' ')
-                            f.write(str(x))
-                    else:
-                        for x in content:
-                            traverse(x, level + 1)
-                traverse(content, 0)
+                if hasattr(content, '__len__'):
+                    shape = cls._text_input_shape(content)
+                    cls._write_text_input(f, content, shape)
+                else:
+                    shape = None
+                    for chunk in content:
+                        chunk_shape = cls._text_input_shape(chunk)
+                        if shape is None:
+                            shape = chunk_shape
+                        elif chunk_shape[1:] != shape[1:]:
+                            raise CompilerError(
+                                'chunk shape %s contradicts earlier '
+                                'chunks' % chunk_shape)
+                        else:
+                            shape[0] += chunk_shape[0]
+                        cls._write_text_input(f, chunk, chunk_shape)
+                    if shape is None:
+                        raise CompilerError('no content')
                 f.write('\n')
                 f.flush()
             if requested_shape is not None and \
@@ -694,7 +750,7 @@ class _register(Tape.Register, _number, _structure):
 
     @vectorized_classmethod
     def conv(cls, val):
-        if isinstance(val, MemValue):
+        if isinstance(val, (MemValue, LazyExpression)):
             val = val.read()
         if isinstance(val, cls):
             return val
@@ -4326,6 +4382,8 @@ class _single(_number, _secret_structure):
     @classmethod
     @read_mem_value
     def conv(cls, other):
+        if isinstance(other, LazyExpression):
+            other = other.read()
         if isinstance(other, cls):
             return other
         elif isinstance(other, (list, tuple)):
@@ -4989,6 +5047,136 @@ class unreduced_sfix(_single):
 
 sfix.unreduced_type = unreduced_sfix
 
+class LazyExpression(object):
+    """ Sum of products of secret values (including vectors) that is
+    only computed when needed. Products of :py:class:`sint` values of
+    the same size are computed with one dot product instruction, and
+    products of :py:class:`sfix` values of the same size and precision
+    (including with :py:class:`cfix`) are summed before a single
+    truncation. The following computes two multiplications with one
+    truncation instead of two::
+
+      a, b, c, d = (sfix.get_input_from(0, size=100) for i in range(4))
+      res = LazyExpression(a) * b + LazyExpression(c) * d
+      print_ln('%s', res.reveal())
+
+    An expression is computed when revealed, compared, or converted
+    to a basic type, for example when assigned to an
+    :py:class:`Array`. Use :py:func:`read` to compute it
+    explicitly. Values that are not wrapped in an expression are
+    computed as usual, so ``LazyExpression(a) * b + c * d`` only
+    defers the first product. Expressions are not hashable because
+    ``==`` computes a comparison.
+
+    :param value: secret value or vector
+    """
+    def __init__(self, value=None, terms=None):
+        if terms is None:
+            terms = [(value, None)]
+        self.terms = terms
+
+    @staticmethod
+    def _terms(other):
+        if isinstance(other, LazyExpression):
+            return other.terms
+        else:
+            return [(other, None)]
+
+    def _factor(self):
+        if all(y is None for x, y in self.terms):
+            return util.tree_reduce(operator.add, (x for x, y in self.terms))
+        else:
+            return self.read()
+
+    def __add__(self, other):
+        return LazyExpression(terms=self.terms + self._terms(other))
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return LazyExpression(terms=[(-x, y) for x, y in self.terms])
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        if isinstance(other, LazyExpression):
+            other = other._factor()
+        return LazyExpression(terms=[(self._factor(), other)])
+
+    __rmul__ = __mul__
+
+    @staticmethod
+    def _group(x, y):
+        """ Key for products that can be computed together. """
+        if isinstance(x, sint) and isinstance(y, sint) and \
+           x.size == y.size:
+            return sint, x.size
+        if isinstance(y, sfix):
+            x, y = y, x
+        if isinstance(x, sfix) and isinstance(y, (sfix, cfix)) and \
+           (x.k, x.f) == (y.k, y.f) and (x.size == y.size or
+                                         isinstance(y, cfix) and y.size == 1):
+            return sfix, x.k, x.f, x.size
+
+    def read(self):
+        """ Compute expression.
+
+        :returns: basic type (vector)
+        """
+        groups = {}
+        res = []
+        for x, y in self.terms:
+            key = None if y is None else self._group(x, y)
+            if key is None:
+                res.append(x if y is None else x * y)
+            else:
+                groups.setdefault(key, []).append((x, y))
+        for key, products in groups.items():
+            if len(products) == 1:
+                res.append(operator.mul(*products[0]))
+            elif key[0] is sint:
+                res.append(sint.dot_product(*zip(*products)))
+            else:
+                secret = [(x, y) for x, y in products
+                          if isinstance(x, sfix) and isinstance(y, sfix)]
+                public = [(x, y) if isinstance(x, sfix) else (y, x)
+                          for x, y in products
+                          if not (isinstance(x, sfix) and isinstance(y, sfix))]
+                v = [x.v * y.v for x, y in public]
+                if secret:
+                    v.append(sint.dot_product(
+                        *([xx.pre_mul() for xx in x] for x in zip(*secret))))
+                x = (secret or public)[0][0]
+                v = util.tree_reduce(operator.add, v)
+                res.append(x.unreduced(v).reduce_after_mul())
+        return util.tree_reduce(operator.add, res)
+
+    def reveal(self):
+        """ Compute and reveal expression. """
+        return self.read().reveal()
+
+    def __lt__(self, other):
+        return self.read() < other
+
+    def __le__(self, other):
+        return self.read() <= other
+
+    def __gt__(self, other):
+        return self.read() > other
+
+    def __ge__(self, other):
+        return self.read() >= other
+
+    def __eq__(self, other):
+        return self.read() == other
+
+    def __ne__(self, other):
+        return self.read() != other
+
 sfix.set_precision(16, 31)
 cfix.set_precision(16, 31)
 
@@ -6019,6 +6207,23 @@ class Array(_vectorizable):
         """
         return Array(size, self.value_type, self.get_address(base))
 
+    def view(self, base=0, size=None, stride=1):
+        """ View on entries without copying.
+
+        :param base: start index (regint/cint/int)
+        :param size: number of entries (int, default: until the end)
+        :param stride: distance between entries (int)
+        :returns: :py:class:`StridedView`
+        """
+        if size is None:
+            if not util.is_constant(base):
+                raise CompilerError('size required for run-time base')
+            size = (self.length - base - 1) // stride + 1
+        if util.is_constant(base):
+            assert base + (size - 1) * stride < self.length
+        return StridedView(self.value_type, self.get_address(base), size,
+                           stride * self.value_type.mem_size())
+
     def get(self, indices):
         """ Vector from arbitrary indices.
 
@@ -6358,11 +6563,117 @@ class Array(_vectorizable):
 sint.dynamic_array = Array
 sgf2n.dynamic_array = Array
 
+class StridedView(object):
+    """ View on equally spaced entries of an :py:class:`Array` or
+    multi-dimensional array without copying. Only the address of the
+    first entry and the stride are stored, and addresses are only
+    computed when reading or writing the view. A contiguous view at a
+    compile-time address is accessed using vector instructions with
+    direct addressing. Use :py:func:`Array.view` or
+    :py:func:`SubMultiArray.view` to create a view. The following adds
+    one to the fourth column of a matrix::
+
+      a = sint.Matrix(10, 10)
+      column = a.view(None, 3)
+      column[:] += 1
+
+    :param value_type: basic type
+    :param address: address of first entry (regint/int)
+    :param size: number of entries (int)
+    :param stride: distance between entries in memory (int)
+
+    """
+    def __init__(self, value_type, address, size, stride=1):
+        assert value_type.n_elements() == 1
+        self.value_type = value_type
+        self.address = address
+        self.size = size
+        self.stride = stride
+        self.address_cache = {}
+
+    def __len__(self):
+        return self.size
+
+    def get_addresses(self):
+        """ Addresses of entries. This is a compile-time integer for
+        contiguous views at compile-time addresses of types using one
+        memory cell per entry and a :py:class:`regint` vector
+        otherwise. Vectors are only computed once per basic block. """
+        if self.stride == 1 and util.is_constant(self.address) and \
+           self.value_type.mem_size() == 1:
+            return self.address
+        key = program.curr_block
+        if key not in self.address_cache:
+            if self.stride == 1:
+                res = regint._expand_address(self.address, self.size)
+            else:
+                res = regint.inc(self.size, self.address, self.stride)
+            self.address_cache[key] = res
+        return self.address_cache[key]
+
+    def get_vector(self):
+        """ Vector with content. """
+        addresses = self.get_addresses()
+        if util.is_constant(addresses):
+            return self.value_type.load_mem(addresses, size=self.size)
+        else:
+            return self.value_type.load_mem(addresses)
+
+    def assign_vector(self, vector):
+        """ Assign vector to content.
+
+        :param vector: vector of matching size
+        """
+        assert vector.size == self.size
+        vector.store_in_mem(self.get_addresses())
+
+    def get_part(self, base, size):
+        """ View on part.
+
+        :param base: start index (regint/int)
+        :param size: number of entries (int)
+        """
+        assert size <= self.size
+        return StridedView(self.value_type, self.address + base * self.stride,
+                           size, self.stride)
+
+    def __getitem__(self, index):
+        """ Vector access with ``[:]``. """
+        if isinstance(index, slice) and index == slice(None):
+            return self.get_vector()
+        raise CompilerError('only [:] supported for views')
+
+    def __setitem__(self, index, other):
+        """ Vector assignment with ``[:]``. """
+        if isinstance(index, slice) and index == slice(None):
+            return self.assign_vector(other)
+        raise CompilerError('only [:] supported for views')
+
+    def __str__(self):
+        return '%s view of length %s at %s with stride %s' % (
+            self.value_type, self.size, self.address, self.stride)
+
 
 class SubMultiArray(_vectorizable):
     """ Multidimensional array functionality.  Don't construct this
     directly, use :py:class:`MultiArray` instead. """
     check_indices = True
+    # maximum number of matrix multiplication results computed at
+    # once by all threads together
+    max_matmul_size = 2 ** 20
+
+    @classmethod
+    def matmul_tile(cls, n_cols, n_threads=None):
+        """ Number of result rows to compute in one matrix
+        multiplication instruction such that all threads together
+        stay within :py:attr:`max_matmul_size` results. Every tile
+        requires one round of communication.
+
+        :param n_cols: number of result columns
+        :param n_threads: number of threads (default: one)
+        """
+        return max(1, min(cls.max_matmul_size // (n_threads or 1),
+                          _register.maximum_size) // n_cols)
 
     def __init__(self, sizes, value_type, address, index, debug=None):
         self.sizes = tuple(sizes)
@@ -6372,6 +6683,7 @@ class SubMultiArray(_vectorizable):
         else:
             self.address = None
         self.sub_cache = {}
+        self.view_cache = {}
         self.debug = debug
         if debug:
             library.print_ln_if(self.address + reduce(operator.mul, self.sizes) * self.value_type.n_elements() > program.allocated_mem[self.value_type.reg_type], 'AOF%d:' % len(self.sizes) + self.debug)
@@ -6565,7 +6877,23 @@ class SubMultiArray(_vectorizable):
                         self.address + i + addresses)
                     self.set_column(i, v)
 
-    def get_addresses(self, *indices):
+    def view(self, *indices):
+        """ View on entries with potential asterisks without
+        copying. See :py:func:`get_vector_by_indices` for the
+        indices. Views with asterisks only in the last dimensions are
+        contiguous, which allows direct addressing for compile-time
+        indices.
+
+        :returns: :py:class:`StridedView`
+        """
+        indices = tuple(x.read() if isinstance(x, MemValue) else x
+                        for x in indices)
+        key = program.curr_block, str(indices)
+        if key not in self.view_cache:
+            self.view_cache[key] = self._view(*indices)
+        return self.view_cache[key]
+
+    def _view(self, *indices):
         assert self.value_type.n_elements() == 1
         assert len(indices) == len(self.sizes)
         size = 1
@@ -6583,8 +6911,11 @@ class SubMultiArray(_vectorizable):
             else:
                 base += x * part_size
             last_was_glob = x is None
-        res = regint.inc(size, self.address + base, skip)
-        return res
+        return StridedView(self.value_type, self.address + base, size, skip)
+
+    def get_addresses(self, *indices):
+        view = self.view(*indices)
+        return regint.inc(view.size, view.address, view.stride)
 
     def get_vector_by_indices(self, *indices):
         """
@@ -6595,16 +6926,14 @@ class SubMultiArray(_vectorizable):
             a.get_vector_by_indices(0, None, 1)
 
         """
-        addresses = self.get_addresses(*indices)
-        return self.value_type.load_mem(addresses)
+        return self.view(*indices).get_vector()
 
     def assign_vector_by_indices(self, vector, *indices):
         """
         Assign vector to entries with potential asterisks. See
         :py:func:`get_vector_by_indices` for an example.
         """
-        addresses = self.get_addresses(*indices)
-        vector.store_in_mem(addresses)
+        self.view(*indices).assign_vector(vector)
 
     def same_shape(self):
         """ :return: new multidimensional array with same shape and basic type """
@@ -6807,7 +7136,8 @@ class SubMultiArray(_vectorizable):
                     skip_reduce = set((sint, sfix)) == \
                         set((self.value_type, other.value_type))
                     assert self.value_type == other.value_type or skip_reduce
-                    max_size = _register.maximum_size // res_matrix.sizes[1]
+                    max_size = self.matmul_tile(res_matrix.sizes[1],
+                                                n_threads)
                     @library.multithread(n_threads, self.sizes[0], max_size)
                     def _(base, size):
                         tmp = self.get_part(base, size).direct_mul(
@@ -6950,11 +7280,13 @@ class SubMultiArray(_vectorizable):
         assert res.sizes[0] == self.sizes[1]
         assert res.sizes[1] == other.sizes[1]
         assert len(res.sizes) == 2
-        @library.for_range_multithread(n_threads, 1, self.sizes[1])
-        def _(i):
-            indices = [regint(i), regint.inc(self.sizes[0])]
+        @library.multithread(n_threads, self.sizes[1],
+                             self.matmul_tile(res.sizes[1], n_threads))
+        def _(base, size):
+            indices = [regint.inc(size, base), regint.inc(self.sizes[0])]
             indices += [regint.inc(i) for i in other.sizes]
-            res[i] = self.direct_trans_mul(other, indices=indices)
+            res.assign_part_vector(
+                self.direct_trans_mul(other, indices=indices), base)
 
     def mul_trans_to(self, other, res, n_threads=None):
         """
@@ -6970,11 +7302,13 @@ class SubMultiArray(_vectorizable):
         assert res.sizes[0] == self.sizes[0]
         assert res.sizes[1] == other.sizes[0]
         assert len(res.sizes) == 2
-        @library.for_range_multithread(n_threads, 1, self.sizes[0])
-        def _(i):
-            indices = [regint(i), regint.inc(self.sizes[1])]
+        @library.multithread(n_threads, self.sizes[0],
+                             self.matmul_tile(res.sizes[1], n_threads))
+        def _(base, size):
+            indices = [regint.inc(size, base), regint.inc(self.sizes[1])]
             indices += [regint.inc(i) for i in reversed(other.sizes)]
-            res[i] = self.direct_mul_trans(other, indices=indices)
+            res.assign_part_vector(
+                self.direct_mul_trans(other, indices=indices), base)
 
     def direct_mul_to_matrix(self, other):
         # Obsolete. Use dot().
@@ -7425,6 +7759,8 @@ class MemValue(_mem):
 
     def __init__(self, value, address=None):
         self.last_write_block = None
+        if isinstance(value, LazyExpression):
+            value = value.read()
         if isinstance(value, int):
             self.value_type = regint
             value = regint(value)
@@ -242,6 +242,8 @@ def find_in_dict(d, v):
     return list(d.keys())[list(d.values()).index(v)]
 
 class set_by_id(object):
+    __slots__ = ['content']
+
     def __init__(self, init=[]):
         self.content = {}
         for x in init:
@@ -274,6 +276,8 @@ class set_by_id(object):
         return self
 
 class dict_by_id(object):
+    __slots__ = ['content']
+
     def __init__(self):
         self.content = {}
 
@@ -286,6 +290,9 @@ class dict_by_id(object):
     def __setitem__(self, key, value):
         self.content[id(key)] = (key, value)
 
+    def __delitem__(self, key):
+        del self.content[id(key)]
+
     def keys(self):
         return (x[0] for x in self.content.values())
 
@@ -293,6 +300,8 @@ class dict_by_id(object):
         return self.keys()
 
 class defaultdict_by_id(dict_by_id):
+    __slots__ = ['default']
+
     def __init__(self, default):
         dict_by_id.__init__(self)
         self.default = default
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# compare the time spent in register allocation and the register usage
+# with and without allocation from live intervals (--interval-allocation)
+#
+# usage: Scripts/allocation-benchmark.py [<program> ...] [-- <compile options>]
+#
+# the machine learning programs in Programs/Source are used if none
+# are given, skipping those that fail or take too long to compile
+
+import ast
+import json
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+timeout = 1800
+
+args = sys.argv[1:] + ['--']
+programs = args[:args.index('--')]
+options = args[args.index('--') + 1:-1]
+if not programs:
+    programs = sorted(
+        x[:-4] for x in os.listdir(root + '/Programs/Source')
+        if x.endswith('.mpc') and
+        x.startswith(('keras_', 'torch_', 'benchmark_', 'mnist_', 'alex')))
+
+def compile(program, extra):
+    try:
+        out = subprocess.run(
+            [sys.executable, 'compile.py', '-v', '--profile-compiler'] +
+            options + extra + [program], cwd=root, check=True,
+            timeout=timeout, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+    usage = 0
+    for line in out.splitlines():
+        if line.startswith('Tape register usage: '):
+            usage += sum(ast.literal_eval(line.split(': ', 1)[1]).values())
+    with open(root + '/Programs/Profiles/%s.json' % program) as profile:
+        phases = json.load(profile)['phases']
+    return usage, phases.get('allocation', {}).get('wall', 0)
+
+print('%-30s %12s %12s %9s %9s %8s' % (
+    'program', 'registers', 'interval', 'time', 'interval', 'speedup'))
+total = [0, 0]
+for program in programs:
+    before = compile(program, [])
+    after = before and compile(program, ['--interval-allocation'])
+    if not after:
+        print('%-30s skipped' % program)
+        continue
+    total[0] += before[1]
+    total[1] += after[1]
+    print('%-30s %12d %12d %8.2fs %8.2fs %7.2fx' % (
+        program, before[0], after[0], before[1], after[1],
+        before[1] / max(after[1], 1e-6)))
+if total[0]:
+    print('%-30s %12s %12s %8.2fs %8.2fs %7.2fx' % (
+        'total', '', '', total[0], total[1], total[0] / max(total[1], 1e-6)))
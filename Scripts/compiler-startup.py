@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# measure the time to import the compiler and to compile a small program
+# in fresh processes
+#
+# usage: Scripts/compiler-startup.py [<program> [<compile options>]]
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repetitions = 10
+
+if len(sys.argv) > 1:
+    program = sys.argv[1:]
+else:
+    program = ['l2h_multiplication']
+
+commands = [
+    ('import compiler', [sys.executable, '-c', 'import Compiler.compilerLib']),
+    ('compile %s' % ' '.join(program),
+     [sys.executable, 'compile.py'] + program),
+]
+
+for name, command in commands:
+    times = []
+    for i in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    print('%-40s min %.3f s, median %.3f s' % (
+        name, min(times), statistics.median(times)))
+
+# modules with the highest cumulative import time
+res = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', 'import Compiler.compilerLib'],
+    cwd=root, check=True, stderr=subprocess.PIPE, text=True)
+imports = []
+for line in res.stderr.splitlines()[1:]:
+    self_time, cumulative, module = line.split('|')
+    imports.append((int(cumulative), int(self_time.split(':')[1]),
+                    module.strip()))
+print('Most expensive imports (cumulative/self in ms):')
+for cumulative, self_time, module in sorted(imports, reverse=True)[:10]:
+    print('%8.1f %8.1f %s' % (cumulative / 1000, self_time / 1000, module))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# compare the number of instructions with and without common
+# subexpression elimination (--cse)
+#
+# usage: Scripts/cse-benchmark.py [<program> ...] [-- <compile options>]
+#
+# all programs in Programs/Source are used if none are given,
+# skipping those that fail or take too long to compile
+
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+timeout = 300
+
+args = sys.argv[1:] + ['--']
+programs = args[:args.index('--')]
+options = args[args.index('--') + 1:-1]
+if not programs:
+    programs = sorted(x[:-4] for x in os.listdir(root + '/Programs/Source')
+                      if x.endswith('.mpc'))
+
+def compile(program, extra):
+    start = time.perf_counter()
+    try:
+        subprocess.run([sys.executable, 'compile.py'] + options + extra +
+                       [program], cwd=root, check=True, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+    duration = time.perf_counter() - start
+    with open(root + '/Programs/Schedules/%s.sch' % program) as schedule:
+        tapes = schedule.readlines()[2].split()
+    return sum(int(x.split(':')[1]) for x in tapes), duration
+
+print('%-30s %12s %12s %8s %9s %9s' % ('program', 'before', 'after',
+                                      'saved', 'time', 'time cse'))
+total = [0, 0]
+for program in programs:
+    before = compile(program, [])
+    after = before and compile(program, ['--cse'])
+    if not after:
+        print('%-30s skipped' % program)
+        continue
+    total[0] += before[0]
+    total[1] += after[0]
+    print('%-30s %12d %12d %7.1f%% %8.2fs %8.2fs' % (
+        program, before[0], after[0], 100 * (1 - after[0] / before[0]),
+        before[1], after[1]))
+if total[0]:
+    print('%-30s %12d %12d %7.1f%%' % ('total', total[0], total[1],
+                                       100 * (1 - total[1] / total[0])))
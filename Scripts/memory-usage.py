@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import sys, os
-import collections
 
 sys.path.append('.')
 
@@ -11,28 +10,11 @@ from Compiler.instructions_base import *
 if len(sys.argv) <= 1:
     print('Usage: %s <program>' % sys.argv[0])
 
-res = collections.defaultdict(lambda: 0)
-regs = collections.defaultdict(lambda: 0)
-thread_regs = collections.defaultdict(lambda: 0)
-
-def process(tapename, res, regs):
-    for inst in Tape.read_instructions(tapename):
-        t = inst.type
-        if issubclass(t, DirectMemoryInstruction):
-            res[type(inst.args[0])] = max(inst.args[1].i + inst.size,
-                                       res[type(inst.args[0])]) + 1
-        for arg in inst.args:
-            if isinstance(arg, RegisterArgFormat):
-                regs[type(arg)] = max(regs[type(arg)], arg.i + inst.size)
-
-tapes = Program.read_tapes(sys.argv[1])
+tapes = list(Program.read_tapes(sys.argv[1]))
 n_threads = Program.read_n_threads(sys.argv[1])
 domain_size = Program.read_domain_size(sys.argv[1]) or 8
 
-process(next(tapes), res, regs)
-
-for tapename in tapes:
-    process(tapename, res, thread_regs)
+res, regs, thread_regs = Program.read_usage(tapes)
 
 reverse_formats = dict((v, k) for k, v in ArgFormats.items())
 
@@ -46,12 +28,6 @@ def output(data):
             except:
                 pass
 
-total = 0
-for x in res, regs:
-    total += sum(x.values())
-
-thread_total = sum(thread_regs.values())
-
 print ('Memory:')
 output(regout(res))
 
@@ -62,9 +38,7 @@ if thread_regs:
     print ('Registers in other threads:')
     output(regout(thread_regs))
 
-min = 1 * domain_size
-max = 3 * domain_size
+ram = Program.estimate_ram(res, regs, thread_regs, n_threads, domain_size)
 
 print ('The program requires at least an estimated %f-%f GB of RAM per party.'
-       % (min * (total + thread_total) * 1e-9,
-          max * ((total + (n_threads - 1) * thread_total) * 1e-9)))
+       % (ram[0] * 1e-9, ram[1] * 1e-9))